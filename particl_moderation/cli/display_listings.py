@@ -11,6 +11,9 @@ from prompt_toolkit.filters import Condition
 from prompt_toolkit.layout.processors import BeforeInput
 from rich.console import Console
 from particl_moderation.utils.config import get_full_path
+from particl_moderation.llm.decision import Verdict
+from particl_moderation.llm.generate import get_model_key, get_rules_digest
+from particl_moderation.llm.verdict_cache import get_verdict_cache, verdict_cache_key
 
 
 console = Console()
@@ -101,6 +104,17 @@ class ListingDisplay:
             self.changed_listings[listing["hash"]] = new_type
             self.message = f"Listing moderation decision changed to {new_type}"
 
+    def override_cached_verdicts(self):
+        """Cache the moderator's verdicts, so relisted copies of these listings get them too"""
+        cache = get_verdict_cache()
+        if cache is None:
+            return
+        rules_digest, model_key = get_rules_digest(), get_model_key()
+        for hash, new_type in self.changed_listings.items():
+            listing = next(item for item in self.listings if item["hash"] == hash)
+            key = verdict_cache_key(listing['title'], listing['description'], rules_digest, model_key)
+            cache.put(key, Verdict(new_type, 0, 0, 0, 0, "moderator"))
+
     def save_changes(self):
         results_file = get_full_path("paths.results_file")
         vote_queue_file = get_full_path("paths.vote_queue_file")
@@ -149,6 +163,7 @@ class ListingDisplay:
             with open(vote_queue_file, 'wb') as f:
                 f.writelines(new_vote_queue)
 
+            self.override_cached_verdicts()
             self.changed_listings.clear()
             self.message = "Changes saved successfully."
             self.load_listings()
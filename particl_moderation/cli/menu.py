@@ -15,10 +15,11 @@ from particl_moderation.utils.config import get_config, set_config, get_full_pat
 from particl_moderation.utils.platform_compat import is_windows
 from particl_moderation.utils.error_handler import handle_keyboard_interrupt, initialize_error_handling
 from particl_moderation.utils.queue_utils import process_queue, clear_queue 
+from particl_moderation.utils.listing_index import get_listing_index
 from particl_moderation.utils.continuous_mode import continuous_mode
 from particl_moderation.utils.generate_test_prompts import generate_test_prompts
 from particl_moderation.particl.wallet import ParticlWallet, display_wallet_qr, DEFAULT_MARKET_ADDRESS
-from particl_moderation.particl.search import particl_search
+from particl_moderation.particl.search import particl_search, get_listing_watermark
 from particl_moderation.particl.particl_core_manager import ParticlCoreManager
 from particl_moderation.cli.display_listings import display_processed_listings as display_listings
 from particl_moderation.moderation.rules import initialize_rules
@@ -39,9 +40,6 @@ def clear_screen():
 def print_header():
     console.print(Panel(f"[bold yellow]Particl Marketplace Moderation Tool v{APP_VERSION}[/bold yellow]"))
 
-def get_queue_file() -> str:
-    return get_config("paths.queue_file", "queue.txt")
-
 def get_cache_file():
     return get_config("paths.cache_file", "listing_cache.txt")
 
@@ -65,8 +63,9 @@ def process_test_listings():
         prompt("Press Enter to return to the menu")
 
 def clear_cache():
-    cache_file = get_cache_file()
-    open(cache_file, 'w').close()
+    get_listing_index().clear()
+    # Without the watermark the next scan re-reads the full inbox
+    get_listing_watermark().reset()
     console.print("[green]Cache file cleared.[/green]")
 
 def clear_results():
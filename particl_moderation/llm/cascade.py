@@ -0,0 +1,87 @@
+import threading
+import time
+
+from typing import Callable, Optional
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.decision import DecisionRule, ThresholdRule, Verdict
+
+class ModelCascade:
+    """Classifies with a small, fast model first and only asks the configured
+    model when the first stage is unsure.
+
+    The first stage samples `first_model` under its own (shorter) threshold
+    rule. Its verdict stands when at least `min_agreement` of its samples
+    gave that verdict's answer; a split vote is escalated to the final model,
+    which decides with the regular `llm.decision` rule.
+    """
+    def __init__(self, first_model: str, first_rule: DecisionRule, min_agreement: float = 0.8):
+        self.first_model = first_model
+        self.first_rule = first_rule
+        self.min_agreement = min_agreement
+        self.final_model = ""
+        self._lock = threading.Lock()
+        self.stats = {"listings": 0, "escalated": 0, "first_seconds": 0.0, "final_seconds": 0.0}
+
+    def is_conclusive(self, verdict: Verdict) -> bool:
+        # Not verdict.samples: logprobs verdicts are one request with counts scaled to max_samples
+        total = verdict.true_count + verdict.false_count + verdict.ignore_count
+        if not total:
+            return False
+        agreeing = {"upvote": verdict.true_count, "downvote": verdict.false_count}.get(verdict.label, verdict.ignore_count)
+        return agreeing / total >= self.min_agreement
+
+    def classify(self, final_model: str, classify_with: Callable[[str, Optional[DecisionRule]], Verdict]) -> Verdict:
+        """Run the cascade; `classify_with(model, rule)` classifies the listing with one model"""
+        if final_model == self.first_model:
+            return classify_with(final_model, None)
+        started = time.monotonic()
+        verdict = classify_with(self.first_model, self.first_rule)
+        first_seconds = time.monotonic() - started
+        escalate = not self.is_conclusive(verdict)
+
+        if escalate:
+            started = time.monotonic()
+            verdict = classify_with(final_model, None)._replace(stage=f"stage 2 {final_model}")
+        else:
+            verdict = verdict._replace(stage=f"stage 1 {self.first_model}")
+
+        with self._lock:
+            self.final_model = final_model
+            self.stats["listings"] += 1
+            self.stats["first_seconds"] += first_seconds
+            if escalate:
+                self.stats["escalated"] += 1
+                self.stats["final_seconds"] += time.monotonic() - started
+        return verdict
+
+    def stats_summary(self) -> Optional[str]:
+        with self._lock:
+            stats = dict(self.stats)
+        if not stats["listings"]:
+            return None
+        summary = (f"Model cascade: {stats['escalated']} of {stats['listings']} listings escalated to "
+                   f"{self.final_model} ({stats['escalated'] / stats['listings']:.0%})")
+        if stats["escalated"]:
+            # What the final model alone would have taken, from its average on the escalated listings
+            final_only = stats["final_seconds"] / stats["escalated"] * stats["listings"]
+            saved = final_only - stats["first_seconds"] - stats["final_seconds"]
+            summary += f", about {saved:.1f}s of {final_only:.1f}s saved"
+        return summary
+
+@shared_instance
+def _load_model_cascade() -> ModelCascade:
+    return ModelCascade(
+        get_config("llm.cascade.first_model", "gemma2:2b"),
+        ThresholdRule(
+            threshold=int(get_config("llm.cascade.threshold", 4)),
+            max_samples=int(get_config("llm.cascade.max_samples", 5)),
+        ),
+        min_agreement=float(get_config("llm.cascade.min_agreement", 0.8)),
+    )
+
+def get_model_cascade() -> Optional[ModelCascade]:
+    """Return the shared cascade, or None unless `llm.cascade.enabled` is set"""
+    if not get_config("llm.cascade.enabled", False):
+        return None
+    return _load_model_cascade()
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+
+from typing import Any, Dict, Optional, Tuple
+from particl_moderation.utils.config import get_full_path
+
+PROMPT_HEADER = "You are an operator tasked with classifying online marketplace listings in three different categories: 'true', 'false', or 'ignore'. You are only able to respond to my requests with one of these three words: 'true', 'false', and 'ignore'. To classify listings, you analyze their titles and descriptions and verify if there are terms that match or closely relate to terms contained in each of the following categories:"
+
+PROMPT_INSTRUCTIONS = """For each listing, determine in which category it should go based on its title and description.
+
+If a listing doesn't clearly fit in either the "false" or "true" category, mark it as 'ignore'.
+
+Respond with only the word of the category."""
+
+def render_rules(rules: Dict[str, Any]) -> str:
+    downvote = set()
+    upvote = set()
+    ignore = set()
+
+    for category in rules.values():
+        downvote.update(category.get('downvote', []))
+        upvote.update(category.get('upvote', []))
+        ignore.update(category.get('ignore', []))
+
+    # Sorted so the rendered text is byte-identical across runs and processes
+    downvote, upvote, ignore = sorted(downvote), sorted(upvote), sorted(ignore)
+
+    result = []
+    if not downvote:
+        result.append("- There is no item in the 'false' category, so do not classify any listing as 'false'.")
+    else:
+        result.append(f"- The 'false' category: The listing should go in this category if its title and description matches the following terms or closely relate to them: {', '.join(downvote)}.")
+
+    if not upvote:
+        result.append("- There is no item in the 'true' category, so do not classify any listing as 'true'.")
+    else:
+        result.append(f"- The 'True' category: The listing should go in this category if its title and description matches the following terms or closely relate to them: {', '.join(upvote)}.")
+
+    if ignore:
+        result.append(f"The 'Ignore' category: The listing should go in this category if its title and description content do not match or closely relate to the terms listed in the false category, or if it matches or closely relate to the following terms: {', '.join(ignore)}.")
+
+    return "\n".join(result)
+
+class CompiledRules:
+    """rules_config.json parsed and rendered once.
+
+    `digest` identifies the rules version (a sha256 of the file contents) for
+    anything that has to be invalidated when the rules change.
+
+    Prompts are laid out as a byte-stable static prefix (`system_prompt`:
+    instructions, rules and answer format) followed by the listing, so the
+    model server can reuse the evaluated prefix and only process the listing
+    tokens on each call.
+    """
+    def __init__(self, path: str, data: bytes, mtime_ns: int, size: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.rules: Dict[str, Any] = json.loads(data.decode('utf-8'))
+        self.simplified = render_rules(self.rules)
+        self.system_prompt = f"{PROMPT_HEADER}\n\n{self.simplified}\n\n{PROMPT_INSTRUCTIONS}"
+        self._category_prompts: Dict[Tuple[str, ...], str] = {}
+
+    def system_prompt_for(self, categories: Optional[Tuple[str, ...]] = None) -> str:
+        """System prompt restricted to some rule categories, or the full one for None"""
+        if not categories:
+            return self.system_prompt
+        prompt = self._category_prompts.get(categories)
+        if prompt is None:
+            subset = {name: self.rules[name] for name in categories if name in self.rules}
+            prompt = f"{PROMPT_HEADER}\n\n{render_rules(subset)}\n\n{PROMPT_INSTRUCTIONS}"
+            self._category_prompts[categories] = prompt
+        return prompt
+
+    def listing_message(self, title: str, description: str) -> str:
+        return f"The listing you must evaluate:\nListing title: {title}\nListing description: {description}\n\nYour response:"
+
+    def render_prompt(self, title: str, description: str, categories: Optional[Tuple[str, ...]] = None) -> str:
+        """The whole prompt as a single text, for backends without a system message"""
+        return f"{self.system_prompt_for(categories)}\n\n{self.listing_message(title, description)}\n"
+
+_compiled: Optional[CompiledRules] = None
+_compiled_lock = threading.Lock()
+
+def get_compiled_rules(path: Optional[str] = None) -> CompiledRules:
+    """Return the compiled rules, recompiling only when the file has changed.
+
+    A stat per call detects edits; the file is re-read when its mtime or size
+    moved, and only re-parsed when its contents actually differ. Raises
+    FileNotFoundError / ValueError like reading the file directly would.
+    """
+    global _compiled
+    path = path or get_full_path("rules.config_file")
+    with _compiled_lock:
+        stat = os.stat(path)
+        current = _compiled
+        if current and current.path == path and current.mtime_ns == stat.st_mtime_ns and current.size == stat.st_size:
+            return current
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        if current and current.path == path and current.digest == hashlib.sha256(data).hexdigest():
+            current.mtime_ns, current.size = stat.st_mtime_ns, stat.st_size
+            return current
+
+        _compiled = CompiledRules(path, data, stat.st_mtime_ns, stat.st_size)
+        return _compiled
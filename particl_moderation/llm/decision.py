@@ -0,0 +1,277 @@
+import math
+import random
+import re
+import sys
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from rich.console import Console
+from rich.table import Table
+from particl_moderation.utils.config import get_config
+
+console = Console()
+
+class Verdict(NamedTuple):
+    label: str
+    true_count: int
+    false_count: int
+    ignore_count: int
+    samples: int
+    rule: str
+    # Which model cascade stage decided, empty without a cascade
+    stage: str = ""
+    # Samples whose request failed, counted as ignore
+    failed: int = 0
+
+    @property
+    def counts(self) -> str:
+        return f"{self.true_count}|{self.false_count}|{self.ignore_count}"
+
+class DecisionRule(ABC):
+    """Decides a listing's verdict from the classification samples seen so far.
+
+    `decide` is called after every sample and returns "upvote", "downvote" or
+    "ignore" once no further sample is needed, or None to ask for another one.
+    It must return a verdict once `max_samples` samples have been taken.
+    """
+    name = "rule"
+
+    def __init__(self, max_samples: int = 10):
+        self.max_samples = max_samples
+
+    @abstractmethod
+    def decide(self, true_count: int, false_count: int, ignore_count: int) -> Optional[str]:
+        ...
+
+    def samples_needed(self, true_count: int, false_count: int, ignore_count: int) -> int:
+        """Lower bound on the further samples needed before `decide` can return a verdict.
+
+        Used to avoid dispatching samples whose answers could never be used.
+        """
+        return 1
+
+    def verdict(self, true_count: int, false_count: int, ignore_count: int) -> Optional[Verdict]:
+        label = self.decide(true_count, false_count, ignore_count)
+        if label is None:
+            return None
+        return Verdict(label, true_count, false_count, ignore_count, true_count + false_count + ignore_count, self.name)
+
+class ThresholdRule(DecisionRule):
+    """The fixed majority: `threshold` of `max_samples` agreeing samples decide.
+
+    Stops as soon as one side reaches the threshold, or as soon as neither
+    side can reach it with the samples left, so it always gives the same
+    verdict as taking every sample.
+    """
+    name = "threshold"
+
+    def __init__(self, threshold: int = 6, max_samples: int = 10):
+        super().__init__(max_samples)
+        self.threshold = threshold
+
+    def decide(self, true_count: int, false_count: int, ignore_count: int) -> Optional[str]:
+        if true_count >= self.threshold:
+            return "upvote"
+        if false_count >= self.threshold:
+            return "downvote"
+        remaining = self.max_samples - (true_count + false_count + ignore_count)
+        if remaining <= 0 or (true_count + remaining < self.threshold and false_count + remaining < self.threshold):
+            return "ignore"
+        return None
+
+    def samples_needed(self, true_count: int, false_count: int, ignore_count: int) -> int:
+        taken = true_count + false_count + ignore_count
+        # Samples until ignore is certain: neither side can reach the threshold any more
+        until_ignore = self.max_samples - taken - (self.threshold - 1 - max(true_count, false_count))
+        return max(1, min(self.threshold - true_count, self.threshold - false_count, until_ignore))
+
+class SPRTRule(ThresholdRule):
+    """Wald's sequential probability ratio test on top of the hard threshold.
+
+    For each of 'true' and 'false' it tests H0: p = p0 against H1: p = p1,
+    where p is the probability of a sample giving that answer. Accepting H1
+    for one side gives its verdict; accepting H0 for both gives 'ignore'.
+    alpha and beta are the accepted type I and II error rates. Listings the
+    test can't settle fall back to the threshold rule at `max_samples`.
+    """
+    name = "sprt"
+
+    def __init__(self, threshold: int = 6, max_samples: int = 10, p0: float = 0.4, p1: float = 0.8,
+                 alpha: float = 0.05, beta: float = 0.05, min_samples: int = 3):
+        super().__init__(threshold, max_samples)
+        self.min_samples = min_samples
+        self.hit_llr = math.log(p1 / p0)
+        self.miss_llr = math.log((1 - p1) / (1 - p0))
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    def _llr(self, hits: int, samples: int) -> float:
+        return hits * self.hit_llr + (samples - hits) * self.miss_llr
+
+    def _test(self, hits: int, samples: int) -> Optional[bool]:
+        llr = self._llr(hits, samples)
+        if llr >= self.upper:
+            return True
+        if llr <= self.lower:
+            return False
+        return None
+
+    def decide(self, true_count: int, false_count: int, ignore_count: int) -> Optional[str]:
+        label = super().decide(true_count, false_count, ignore_count)
+        if label is not None:
+            return label
+
+        samples = true_count + false_count + ignore_count
+        if samples < self.min_samples:
+            return None
+        true_result = self._test(true_count, samples)
+        false_result = self._test(false_count, samples)
+        if true_result:
+            return "upvote"
+        if false_result:
+            return "downvote"
+        if true_result is False and false_result is False:
+            return "ignore"
+        return None
+
+    def samples_needed(self, true_count: int, false_count: int, ignore_count: int) -> int:
+        needed = super().samples_needed(true_count, false_count, ignore_count)
+        taken = true_count + false_count + ignore_count
+        true_llr = self._llr(true_count, taken)
+        false_llr = self._llr(false_count, taken)
+        # Fastest way for the test to stop: all further samples agree on one side,
+        # or all of them are 'ignore' and push both ratios below the lower bound
+        to_accept = math.ceil((self.upper - max(true_llr, false_llr)) / self.hit_llr)
+        to_reject = math.ceil((max(true_llr, false_llr) - self.lower) / -self.miss_llr)
+        sprt_needed = max(1, self.min_samples - taken, min(to_accept, to_reject))
+        return max(1, min(needed, sprt_needed))
+
+def get_decision_rule() -> DecisionRule:
+    """Build the stopping rule configured under `llm.decision`"""
+    threshold = int(get_config("llm.decision.threshold", 6))
+    max_samples = int(get_config("llm.decision.max_samples", 10))
+    if get_config("llm.decision.rule", "threshold") == "sprt":
+        return SPRTRule(
+            threshold=threshold,
+            max_samples=max_samples,
+            p0=float(get_config("llm.decision.p0", 0.4)),
+            p1=float(get_config("llm.decision.p1", 0.8)),
+            alpha=float(get_config("llm.decision.alpha", 0.05)),
+            beta=float(get_config("llm.decision.beta", 0.05)),
+            min_samples=int(get_config("llm.decision.min_samples", 3)),
+        )
+    return ThresholdRule(threshold=threshold, max_samples=max_samples)
+
+def verdict_from_probabilities(probabilities: Dict[str, float], rule: ThresholdRule) -> Verdict:
+    """Apply the threshold to an estimated label distribution from a single request.
+
+    The probabilities are scaled to `max_samples` pseudo-counts (largest
+    remainder rounding, so they add up) to keep results.txt comparable.
+    """
+    labels = ("true", "false", "ignore")
+    scaled = [probabilities.get(label, 0.0) * rule.max_samples for label in labels]
+    counts = [int(value) for value in scaled]
+    by_remainder = sorted(range(len(labels)), key=lambda i: scaled[i] - counts[i], reverse=True)
+    for i in by_remainder[:rule.max_samples - sum(counts)]:
+        counts[i] += 1
+
+    ratio = rule.threshold / rule.max_samples
+    if probabilities.get("true", 0.0) >= ratio:
+        label = "upvote"
+    elif probabilities.get("false", 0.0) >= ratio:
+        label = "downvote"
+    else:
+        label = "ignore"
+    return Verdict(label, counts[0], counts[1], counts[2], 1, "logprobs")
+
+# Noted in the llm_response of verdicts with failed requests, whose counts say nothing about the listing
+FAILED_REQUESTS_NOTE = "failed requests"
+
+COUNTS_PATTERN = re.compile(r'Counts:\s*(\d+)\|(\d+)\|(\d+)\s*$')
+
+def load_vote_splits(results_file: str) -> List[Tuple[int, int, int]]:
+    """Read the true/false/ignore splits of past sampled runs from results.txt"""
+    splits = []
+    with open(results_file, 'rb') as f:
+        for raw_line in f:
+            line = raw_line.decode('utf-8', errors='replace')
+            if "Cached verdict" in line or "logprobs)" in line or FAILED_REQUESTS_NOTE in line:
+                # Repeats of earlier splits, estimates rather than samples, or failed requests
+                continue
+            match = COUNTS_PATTERN.search(line)
+            if match:
+                splits.append(tuple(int(n) for n in match.groups()))
+    return splits
+
+def replay(rule: DecisionRule, splits: Iterable[Tuple[int, int, int]], reference: DecisionRule,
+           orderings: int = 20, seed: int = 0) -> Dict[str, float]:
+    """Replay recorded splits through `rule` in random sample orders.
+
+    Each split is treated as the multiset of answers a listing produced; the
+    samples are drawn from it in `orderings` random orders, and the verdict
+    is compared with what `reference` decides from the full split.
+    """
+    rng = random.Random(seed)
+    runs = agreements = samples_used = 0
+    for true_count, false_count, ignore_count in splits:
+        expected = reference.decide(true_count, false_count, ignore_count)
+        answers = ["true"] * true_count + ["false"] * false_count + ["ignore"] * ignore_count
+        for _ in range(orderings):
+            rng.shuffle(answers)
+            counts = {"true": 0, "false": 0, "ignore": 0}
+            verdict = None
+            for answer in answers:
+                counts[answer] += 1
+                verdict = rule.verdict(counts["true"], counts["false"], counts["ignore"])
+                if verdict:
+                    break
+            runs += 1
+            agreements += verdict.label == expected
+            samples_used += verdict.samples
+    if not runs:
+        return {"agreement": 0.0, "mean_samples": 0.0}
+    return {"agreement": agreements / runs, "mean_samples": samples_used / runs}
+
+def calibrate(results_file: str, target_agreement: float = 0.99) -> Optional[Dict[str, float]]:
+    """Search SPRT parameters against past results and print the trade-offs"""
+    threshold = int(get_config("llm.decision.threshold", 6))
+    max_samples = int(get_config("llm.decision.max_samples", 10))
+    try:
+        # Early-stopped verdicts don't carry the full split, only replay complete runs
+        splits = [s for s in load_vote_splits(results_file) if sum(s) >= max_samples]
+    except OSError as e:
+        console.print(f"[red]Error reading {results_file}: {str(e)}[/red]")
+        return None
+    if not splits:
+        console.print("[yellow]No full-length vote splits found in results file.[/yellow]")
+        return None
+
+    reference = ThresholdRule(threshold, max_samples)
+    baseline = replay(reference, splits, reference)
+
+    table = Table(title=f"Stopping rules replayed over {len(splits)} past listings")
+    for column in ("Rule", "p0", "p1", "alpha/beta", "Agreement", "Mean samples"):
+        table.add_column(column)
+    table.add_row("threshold", "-", "-", "-", f"{baseline['agreement']:.3f}", f"{baseline['mean_samples']:.2f}")
+
+    best = None
+    for p0, p1 in ((0.3, 0.7), (0.4, 0.8), (0.5, 0.8), (0.5, 0.9)):
+        for error_rate in (0.01, 0.02, 0.05, 0.1):
+            rule = SPRTRule(threshold, max_samples, p0, p1, error_rate, error_rate)
+            stats = replay(rule, splits, reference)
+            table.add_row("sprt", str(p0), str(p1), str(error_rate), f"{stats['agreement']:.3f}", f"{stats['mean_samples']:.2f}")
+            if stats["agreement"] >= target_agreement and (best is None or stats["mean_samples"] < best["mean_samples"]):
+                best = {"p0": p0, "p1": p1, "alpha": error_rate, "beta": error_rate, **stats}
+
+    console.print(table)
+    if best:
+        console.print(f"[green]Suggested llm.decision settings: rule: sprt, p0: {best['p0']}, p1: {best['p1']}, "
+                      f"alpha: {best['alpha']}, beta: {best['beta']} "
+                      f"({best['mean_samples']:.2f} samples per listing, {best['agreement']:.1%} agreement).[/green]")
+    else:
+        console.print(f"[yellow]No SPRT setting reached {target_agreement:.0%} agreement, keep rule: threshold.[/yellow]")
+    return best
+
+if __name__ == "__main__":
+    results_file = sys.argv[1] if len(sys.argv) > 1 else get_config("paths.results_file", "results.txt")
+    calibrate(results_file)
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.decision import FAILED_REQUESTS_NOTE, Verdict
+from particl_moderation.llm.ollama_client import OllamaError, get_ollama_client
+from particl_moderation.llm.verdict_cache import normalize_text
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+console = Console()
+
+LABELS = ("upvote", "downvote", "ignore")
+
+# llm_response values of results.txt entries that weren't decided by the model
+NON_MODEL_RESPONSES = ("Prefilter", "Nearest neighbours", "Empty title")
+
+RESULT_PATTERN = re.compile(
+    r'^\[(?P<date>[^\]]*)\]\s*(?P<type>\w+) \| (?P<hash>[^|]*?) \| (?P<body>.*) \| (?P<response>[^|]*) \| Counts: [\d|]*\s*$'
+)
+
+def get_embedding_model() -> str:
+    return get_config("knn.embedding_model", "nomic-embed-text")
+
+def listing_text(title: str, description: str) -> str:
+    return f"{title}\n{description}"
+
+def embed_texts(texts: List[str], batch_size: int = 64) -> Optional["np.ndarray"]:
+    """Embed texts with Ollama and return them as unit-length float32 rows, or None if that failed"""
+    client = get_ollama_client()
+    if client is None or np is None:
+        return None
+    rows = []
+    try:
+        for start in range(0, len(texts), batch_size):
+            rows.extend(client.embed(get_embedding_model(), texts[start:start + batch_size]))
+    except OllamaError as e:
+        console.print(f"[yellow]Embedding request failed: {str(e)}[/yellow]")
+        return None
+    if len(rows) != len(texts):
+        return None
+    vectors = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+_listing_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_listing_vectors_lock = threading.Lock()
+
+def embed_listing(title: str, description: str) -> Optional["np.ndarray"]:
+    """Embedding of a listing, memoised so the lookups, rule selection and
+    indexing of one listing share a single embedding request"""
+    key = hashlib.sha256(normalize_text(listing_text(title, description)).encode('utf-8')).hexdigest()
+    with _listing_vectors_lock:
+        if key in _listing_vectors:
+            _listing_vectors.move_to_end(key)
+            return _listing_vectors[key]
+    vectors = embed_texts([listing_text(title, description)])
+    if vectors is None:
+        return None
+    with _listing_vectors_lock:
+        _listing_vectors[key] = vectors[0]
+        while len(_listing_vectors) > 1000:
+            _listing_vectors.popitem(last=False)
+    return vectors[0]
+
+def is_model_response(llm_response: str) -> bool:
+    return not llm_response.startswith(NON_MODEL_RESPONSES) and FAILED_REQUESTS_NOTE not in llm_response
+
+def iter_results(results_file: str) -> Iterator[Tuple[str, str, str, str, str]]:
+    """Yield (hash, verdict, title, description, llm_response) for each parsable results.txt line"""
+    if not os.path.exists(results_file):
+        return
+    with open(results_file, 'rb') as f:
+        for raw_line in f:
+            match = RESULT_PATTERN.match(raw_line.decode('utf-8', errors='replace').strip())
+            if not match or match.group('type') not in LABELS:
+                continue
+            title, _, description = match.group('body').partition(' | ')
+            yield match.group('hash'), match.group('type'), title, description, match.group('response')
+
+class EmbeddingIndex:
+    """Embeddings of already classified listings with their verdicts, for nearest-neighbour lookups.
+
+    Vectors are unit-normalised float32 rows appended to a flat file that is
+    memory-mapped for search, so cosine similarity against the whole history
+    is a single matrix-vector product. A JSON-lines sidecar holds the header
+    (embedding model, dimension) and one [listing hash, verdict] per row.
+    """
+    def __init__(self, vectors_path: str, model: str, top_k: int = 5, min_similarity: float = 0.95):
+        self.vectors_path = vectors_path
+        self.meta_path = f"{vectors_path}.meta"
+        self.model = model
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self._lock = threading.RLock()
+        self.dim = 0
+        self.hashes: List[str] = []
+        self.labels: List[int] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = None
+        self.stats = {"lookups": 0, "hits": 0}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                rows = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            console.print(f"[yellow]Embedding index {self.meta_path} is unreadable ({e}). Rebuilding it.[/yellow]")
+            self.reset()
+            return
+        if header.get("model") != self.model:
+            # Vectors from another embedding model aren't comparable
+            self.reset()
+            return
+
+        self.dim = int(header.get("dim", 0))
+        vector_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if self.dim and os.path.exists(self.vectors_path) else 0
+        # A crash between the two appends leaves one file a row ahead
+        count = min(vector_rows, len(rows))
+        for listing_hash, label in rows[:count]:
+            self._rows[listing_hash] = len(self.hashes)
+            self.hashes.append(listing_hash)
+            self.labels.append(LABELS.index(label))
+
+        # Drop the extra rows, or the next append would pair every later verdict with the wrong vector
+        try:
+            if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != count * self.dim * 4:
+                os.truncate(self.vectors_path, count * self.dim * 4)
+            if len(rows) != count:
+                self._write_meta()
+        except OSError as e:
+            console.print(f"[yellow]Embedding index {self.vectors_path} can't be repaired ({e}). Rebuilding it.[/yellow]")
+            self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.dim = 0
+            self.hashes, self.labels, self._rows = [], [], {}
+            self._matrix = None
+            for path in (self.vectors_path, self.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _get_matrix(self) -> Optional["np.ndarray"]:
+        if not self.hashes:
+            return None
+        if self._matrix is None or len(self._matrix) != len(self.hashes):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(len(self.hashes), self.dim))
+        return self._matrix
+
+    def _write_meta(self) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"model": self.model, "dim": self.dim}) + "\n")
+            for listing_hash, label in zip(self.hashes, self.labels):
+                f.write(json.dumps([listing_hash, LABELS[label]]) + "\n")
+        os.replace(tmp_path, self.meta_path)
+
+    def _append(self, entries: List[Tuple[str, str]], vectors: "np.ndarray") -> None:
+        with self._lock:
+            if not self.dim:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+            if vectors.shape[1] != self.dim:
+                return
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.meta_path, 'a', encoding='utf-8') as f:
+                for listing_hash, label in entries:
+                    self._rows[listing_hash] = len(self.hashes)
+                    self.hashes.append(listing_hash)
+                    self.labels.append(LABELS.index(label))
+                    f.write(json.dumps([listing_hash, label]) + "\n")
+
+    def lookup(self, title: str, description: str) -> Optional[Verdict]:
+        """Return the shared verdict of the nearest past listings if they are all close and agree"""
+        query = embed_listing(title, description)
+        if query is None:
+            return None
+        with self._lock:
+            self.stats["lookups"] += 1
+            matrix = self._get_matrix()
+            if matrix is None or len(matrix) < self.top_k or query.shape[0] != self.dim:
+                return None
+            similarities = matrix @ query
+            nearest = np.argpartition(-similarities, self.top_k - 1)[:self.top_k]
+            labels = {self.labels[i] for i in nearest}
+            closest = float(similarities[nearest].min())
+            if len(labels) != 1 or closest < self.min_similarity:
+                return None
+            self.stats["hits"] += 1
+            return Verdict(LABELS[labels.pop()], 0, 0, 0, 0, "knn")
+
+    def record(self, listing_hash: str, label: str, title: str, description: str) -> None:
+        if label not in LABELS or listing_hash in self._rows:
+            return
+        vector = embed_listing(title, description)
+        if vector is not None:
+            self._append([(listing_hash, label)], vector[None, :])
+
+    def sync_with_results(self, results_file: str) -> None:
+        """Add results.txt entries missing from the index and pick up verdicts edited since"""
+        missing: Dict[str, Tuple[str, str, str]] = {}
+        relabelled = False
+        with self._lock:
+            for listing_hash, label, title, description, response in iter_results(results_file):
+                if not is_model_response(response):
+                    continue
+                row = self._rows.get(listing_hash)
+                if row is None:
+                    missing[listing_hash] = (label, title, description)
+                elif self.labels[row] != LABELS.index(label):
+                    self.labels[row] = LABELS.index(label)
+                    relabelled = True
+            if relabelled:
+                self._write_meta()
+
+        if not missing:
+            return
+        console.print(f"Embedding {len(missing)} past results for nearest-neighbour lookups...")
+        hashes = list(missing)
+        vectors = embed_texts([listing_text(missing[h][1], missing[h][2]) for h in hashes])
+        if vectors is not None:
+            self._append([(h, missing[h][0]) for h in hashes], vectors)
+
+    def stats_summary(self) -> Optional[str]:
+        if not self.stats["lookups"]:
+            return None
+        return (f"Nearest neighbours: {self.stats['hits']} of {self.stats['lookups']} listings took the verdict "
+                f"of similar past listings ({len(self)} indexed)")
+
+_numpy_warning_shown = False
+
+@shared_instance
+def _load_embedding_index() -> EmbeddingIndex:
+    return EmbeddingIndex(
+        get_config("paths.knn_index_file", "knn_index.f32"),
+        get_embedding_model(),
+        top_k=int(get_config("knn.top_k", 5)),
+        min_similarity=float(get_config("knn.min_similarity", 0.95)),
+    )
+
+def get_embedding_index() -> Optional[EmbeddingIndex]:
+    """Return the shared index, or None unless `knn.enabled` is set and NumPy is installed"""
+    global _numpy_warning_shown
+    if not get_config("knn.enabled", False):
+        return None
+    if np is None:
+        if not _numpy_warning_shown:
+            console.print("[yellow]Nearest-neighbour verdicts need NumPy (pip install numpy), skipping them.[/yellow]")
+            _numpy_warning_shown = True
+        return None
+    return _load_embedding_index()
+
+def record_result(listing_hash: str, label: str, title: str, description: str, llm_response: str) -> None:
+    """Index a freshly logged model verdict. Embeds the listing, so call it outside any results lock"""
+    if not is_model_response(llm_response):
+        return
+    index = get_embedding_index()
+    if index is None:
+        return
+    try:
+        index.record(listing_hash, label, title, description)
+    except OSError as e:
+        console.print(f"[yellow]Error updating embedding index: {str(e)}[/yellow]")
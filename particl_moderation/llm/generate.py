@@ -1,29 +1,64 @@
 import json
+import math
 import subprocess
 import os
 import shlex
 import sys
 
-from typing import Tuple, Dict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set, Tuple
 from particl_moderation.utils.config import get_config, get_full_path
 from particl_moderation.utils.error_handler import handle_keyboard_interrupt, initialize_error_handling, check_for_interrupt
 from particl_moderation.utils.platform_compat import is_windows
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.cascade import get_model_cascade
+from particl_moderation.llm.compiled_rules import CompiledRules, get_compiled_rules
+from particl_moderation.llm.decision import DecisionRule, ThresholdRule, Verdict, get_decision_rule, verdict_from_probabilities
+from particl_moderation.llm.rule_selection import get_rule_selector
+from particl_moderation.llm.ollama_client import OllamaClient, OllamaError, OllamaUnavailableError, get_endpoints, get_ollama_client, get_generation_options
 
 
 initialize_error_handling()
 
+CLASSIFICATION_LABELS = ("true", "false", "ignore")
+
+# Returned by generate_prompt_and_send when the model couldn't be asked
+SAMPLE_FAILED = "failed"
+
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "label": {"type": "string", "enum": list(CLASSIFICATION_LABELS)}
+    },
+    "required": ["label"]
+}
+
 def get_current_model() -> str:
     model = get_config("llm.model", "gemma2:2b")
     if not model:
         return "gemma2:2b"
     return model
 
+def get_model_key() -> str:
+    """Identifies the model(s) verdicts come from, so cached ones don't outlive a model change"""
+    cascade = get_model_cascade()
+    if cascade:
+        return f"{cascade.first_model}>{get_current_model()}"
+    return get_current_model()
+
 def get_rules_config_path() -> str:
     return get_full_path("rules.config_file")
 
 def get_predefined_rules_path() -> str:
     return get_full_path("rules.predefined_file")
 
+def get_rules_digest() -> str:
+    """Version digest of the active rules, changes whenever the rules do"""
+    try:
+        return get_compiled_rules(get_rules_config_path()).digest
+    except (OSError, ValueError):
+        return ""
+
 def verify_rules_configuration() -> bool:
     rules_config_path = get_full_path('rules.config_file')
 
@@ -61,84 +96,228 @@ def verify_rules_configuration() -> bool:
         print(f"Error verifying rules configuration: {str(e)}", file=sys.stderr)
         return False
 
-def simplify_rules(config_file: str) -> str:
-    with open(config_file, 'r') as f:
-        rules = json.load(f)
+def get_max_parallel() -> int:
+    """Number of classification requests allowed in flight: `llm.max_parallel`, which
+    should match OLLAMA_NUM_PARALLEL, for each configured endpoint"""
+    return max(1, int(get_config("llm.max_parallel", 4))) * len(get_endpoints())
 
-    downvote = set()
-    upvote = set()
-    ignore = set()
-
-    for category in rules.values():
-        downvote.update(category.get('downvote', []))
-        upvote.update(category.get('upvote', []))
-        ignore.update(category.get('ignore', []))
-
-    result = []
-    if not downvote:
-        result.append("- There is no item in the 'false' category, so do not classify any listing as 'false'.")
-    else:
-        result.append(f"- The 'false' category: The listing should go in this category if its title and description matches the following terms or closely relate to them: {', '.join(downvote)}.")
-
-    if not upvote:
-        result.append("- There is no item in the 'true' category, so do not classify any listing as 'true'.")
-    else:
-        result.append(f"- The 'True' category: The listing should go in this category if its title and description matches the following terms or closely relate to them: {', '.join(upvote)}.")
-
-    if ignore:
-        result.append(f"The 'Ignore' category: The listing should go in this category if its title and description content do not match or closely relate to the terms listed in the false category, or if it matches or closely relate to the following terms: {', '.join(ignore)}.")
-
-    return "\n".join(result)
+@shared_instance
+def get_sample_executor() -> ThreadPoolExecutor:
+    """Shared pool every classification sample goes through, so concurrency stays capped
+    at `llm.max_parallel` even when several listings are classified at once"""
+    return ThreadPoolExecutor(max_workers=get_max_parallel(), thread_name_prefix="llm-sample")
 
 @handle_keyboard_interrupt
-def multiple_llm_calls(title: str, description: str) -> Tuple[int, int, int]:
-    true_count = 0
-    false_count = 0
-    ignore_count = 0
+def multiple_llm_calls(title: str, description: str, rule: Optional[DecisionRule] = None,
+                       categories: Optional[Tuple[str, ...]] = None, model: Optional[str] = None) -> Verdict:
+    """Sample the model until the decision rule reaches a verdict.
+
+    Samples run concurrently on the shared pool, but no more are dispatched
+    than the rule could still use, and whatever is pending once it decides
+    is cancelled.
+    """
+    rule = rule or get_decision_rule()
+    counts = {"true": 0, "false": 0, "ignore": 0}
+    failed = 0
+    executor = get_sample_executor()
+    max_parallel = get_max_parallel()
+    pending: Set[Future] = set()
+    submitted = 0
 
-    for _ in range(10):
-        check_for_interrupt()
-        try:
-            response = generate_prompt_and_send(title, description)
-            if response == "true":
-                true_count += 1
-            elif response == "false":
-                false_count += 1
-            else:
-                ignore_count += 1
-        except KeyboardInterrupt:
-            print("\nLLM calls interrupted by user.")
-            raise
-
-    return true_count, false_count, ignore_count
+    try:
+        while True:
+            check_for_interrupt()
+            verdict = rule.verdict(counts["true"], counts["false"], counts["ignore"])
+            if verdict:
+                return verdict._replace(failed=failed)
+
+            wanted = min(max_parallel, rule.max_samples - submitted,
+                         rule.samples_needed(counts["true"], counts["false"], counts["ignore"]) - len(pending))
+            for _ in range(max(0, wanted)):
+                pending.add(executor.submit(generate_prompt_and_send, title, description, categories, model))
+                submitted += 1
+
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                response = future.result()
+                if response == SAMPLE_FAILED:
+                    failed += 1
+                counts[response if response in counts else "ignore"] += 1
+                if rule.decide(counts["true"], counts["false"], counts["ignore"]):
+                    break
+    except KeyboardInterrupt:
+        print("\nLLM calls interrupted by user.")
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
 
 @handle_keyboard_interrupt
-def generate_prompt_and_send(title: str, description: str) -> str:
+def generate_prompt_and_send(title: str, description: str, categories: Optional[Tuple[str, ...]] = None,
+                             model: Optional[str] = None) -> str:
     rules_config_file = get_rules_config_path()
-    model = get_current_model()
-    
+    model = model or get_current_model()
+
     try:
-        simplified_rules = simplify_rules(rules_config_file)
+        compiled_rules = get_compiled_rules(rules_config_file)
     except FileNotFoundError:
         print(f"Error: {rules_config_file} not found.", file=sys.stderr)
-        return "ignore"
-
-    prompt = f"""
-You are an operator tasked with classifying online marketplace listings in three different categories: 'true', 'false', or 'ignore'. You are only able to respond to my requests with one of these three words: 'true', 'false', and 'ignore'. To classify listings, you analyze their titles and descriptions and verify if there are terms that match or closely relate to terms contained in each of the following categories:
-
-{simplified_rules}
-
-The listing you must evaluate:
-Listing title: {title}
-Listing description: {description}
-
-Determine in which category this listing should go based on its title and description.
-
-If a listing doesn't clearly fit in either the "false" or "true" category, mark it as 'ignore'.
+        return SAMPLE_FAILED
 
-Your response(respond with only the word of the category):
-"""
+    client = get_ollama_client()
+    if client is not None:
+        try:
+            structured = get_config("llm.structured_output", True)
+            response = _send_classification_request(client, model, compiled_rules, title, description, structured,
+                                                    categories=categories)
+            content = _response_content(response)
+            return parse_structured_response(content) if structured else parse_classification_response(content)
+        except OllamaUnavailableError:
+            pass
+        except OllamaError as e:
+            print(f"Error: Ollama request failed: {str(e)}", file=sys.stderr)
+            return SAMPLE_FAILED
+
+    full_response = _run_ollama_cli(model, compiled_rules.render_prompt(title, description, categories))
+    if full_response is None:
+        return SAMPLE_FAILED
+    return parse_classification_response(full_response)
+
+def get_classification_options(structured: bool) -> Dict:
+    # With the output constrained to {"label": ...} a handful of tokens is enough,
+    # and the closing brace ends generation; `llm.options` can override both
+    options = {"num_predict": 16, "stop": ["}"]} if structured else {}
+    options.update(get_generation_options())
+    return options
+
+def _send_classification_request(client: OllamaClient, model: str, compiled_rules: CompiledRules, title: str,
+                                 description: str, structured: bool, categories: Optional[Tuple[str, ...]] = None,
+                                 **extra) -> Dict:
+    options = get_classification_options(structured)
+    if structured:
+        extra["format"] = CLASSIFICATION_SCHEMA
+
+    if get_config("llm.prompt_layout", "chat") == "chat":
+        # The rules go in a fixed system message, so Ollama can reuse the
+        # evaluated context and only process the listing on each call
+        messages = [
+            {"role": "system", "content": compiled_rules.system_prompt_for(categories)},
+            {"role": "user", "content": compiled_rules.listing_message(title, description)},
+        ]
+        return client.chat(model, messages, options=options, **extra)
+    prompt = compiled_rules.render_prompt(title, description, categories)
+    return client.generate(model, prompt, options=options, **extra)
+
+def _response_content(response: Dict) -> str:
+    if "message" in response:
+        return response["message"].get("content", "")
+    return response.get("response", "")
+
+def label_probabilities(logprobs: List[Dict]) -> Optional[Dict[str, float]]:
+    """Turn the token log-probabilities of a reply into true/false/ignore probabilities.
+
+    The labels start with distinct letters, so the first generated token that
+    begins a label is where the model chose between them; the alternatives
+    in its top_logprobs are mapped back to labels by prefix.
+    """
+    for entry in logprobs:
+        if _token_label(entry.get("token", "")) is None:
+            continue
+        probabilities = dict.fromkeys(CLASSIFICATION_LABELS, 0.0)
+        for alternative in entry.get("top_logprobs") or [entry]:
+            label = _token_label(alternative.get("token", ""))
+            if label:
+                probabilities[label] += math.exp(alternative.get("logprob", float("-inf")))
+        total = sum(probabilities.values())
+        if not total:
+            return None
+        return {label: p / total for label, p in probabilities.items()}
+    return None
+
+def _token_label(token: str) -> Optional[str]:
+    token = token.strip(' "\'\n').lower()
+    if not token:
+        return None
+    for label in CLASSIFICATION_LABELS:
+        if label.startswith(token):
+            return label
+    return None
+
+_logprobs_unsupported = False
+
+def classify_with_logprobs(title: str, description: str, categories: Optional[Tuple[str, ...]] = None,
+                           model: Optional[str] = None, rule: Optional[ThresholdRule] = None) -> Optional[Verdict]:
+    """Classify with a single request, reading the label distribution from its logprobs.
+
+    Returns None when the server can't provide log-probabilities, so the
+    caller can fall back to sampling.
+    """
+    global _logprobs_unsupported
+    client = get_ollama_client()
+    if client is None or _logprobs_unsupported:
+        return None
+    try:
+        compiled_rules = get_compiled_rules(get_rules_config_path())
+        response = _send_classification_request(
+            client, model or get_current_model(), compiled_rules, title, description,
+            get_config("llm.structured_output", True), categories=categories, logprobs=True, top_logprobs=5
+        )
+    except (OSError, ValueError, OllamaError):
+        return None
+
+    if "logprobs" not in response:
+        # Older servers ignore the option, don't pay for the extra request every time
+        print("Warning: Ollama server doesn't return logprobs, falling back to sampling.", file=sys.stderr)
+        _logprobs_unsupported = True
+        return None
+    probabilities = label_probabilities(response["logprobs"] or [])
+    if probabilities is None:
+        return None
+    return verdict_from_probabilities(probabilities, rule or get_decision_rule())
+
+def _classify_with_model(title: str, description: str, categories: Optional[Tuple[str, ...]], model: str,
+                         rule: Optional[DecisionRule] = None) -> Verdict:
+    if get_config("llm.classification_mode", "sampling") == "logprobs":
+        verdict = classify_with_logprobs(title, description, categories, model, rule)
+        if verdict:
+            return verdict
+    return multiple_llm_calls(title, description, rule, categories, model)
+
+def classify_listing(title: str, description: str) -> Verdict:
+    """Classify a listing with the configured `llm.classification_mode`, through the model cascade if enabled"""
+    selector = get_rule_selector()
+    categories = selector.select(title, description) if selector else None
+    cascade = get_model_cascade()
+    if cascade:
+        return cascade.classify(
+            get_current_model(),
+            lambda model, rule: _classify_with_model(title, description, categories, model, rule)
+        )
+    return _classify_with_model(title, description, categories, get_current_model())
+
+def check_unmatched_listing(title: str, description: str) -> Optional[Verdict]:
+    """Single-sample check for a listing the prefilter found no rule term in.
+
+    Returns an 'ignore' verdict when the sample says so, or None when the
+    listing needs the full classification (including when the request failed).
+    """
+    verdict = multiple_llm_calls(title, description, rule=ThresholdRule(threshold=1, max_samples=1))
+    return verdict._replace(rule="prefilter") if verdict.label == "ignore" and not verdict.failed else None
+
+def parse_structured_response(content: str) -> str:
+    """Read the label out of a schema-constrained {"label": ...} reply"""
+    content = content.strip()
+    if not content.endswith('}'):
+        # The stop sequence swallows the closing brace
+        content += '}'
+    try:
+        label = json.loads(content).get("label")
+    except (ValueError, AttributeError):
+        return "ignore"
+    return label if label in CLASSIFICATION_LABELS else "ignore"
 
+def _run_ollama_cli(model: str, prompt: str) -> Optional[str]:
+    """Fallback for when the Ollama HTTP API isn't reachable"""
     try:
         if is_windows():
             startupinfo = subprocess.STARTUPINFO()
@@ -159,17 +338,24 @@ Your response(respond with only the word of the category):
                 
             if process.returncode != 0:
                 print("Error: Failed to run local model. Check if Ollama is installed and running.", file=sys.stderr)
-                return "ignore"
+                return None
         else:
             # Keep existing behavior for non-Windows systems
             result = subprocess.run(["ollama", "run", model, prompt], capture_output=True, text=True, check=True)
             full_response = result.stdout
 
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, FileNotFoundError):
         print("Error: Failed to run local model. Check if Ollama is installed and running.", file=sys.stderr)
-        return "ignore"
+        return None
+
+    return full_response
 
-    response = [line for line in full_response.split('\n') if line.strip()][-1]
+def parse_classification_response(full_response: str) -> str:
+    """Heuristic parsing of free-form output, for `ollama run` and unconstrained replies"""
+    lines = [line for line in full_response.split('\n') if line.strip()]
+    if not lines:
+        return "ignore"
+    response = lines[-1]
 
     # Process the response
     word_count = len(response.split())
@@ -198,7 +384,7 @@ if __name__ == "__main__":
         title = "Example Product"
         description = "This is a sample product description."
         result = multiple_llm_calls(title, description)
-        print(f"Results: True: {result[0]}, False: {result[1]}, Ignore: {result[2]}")
+        print(f"Results: True: {result.true_count}, False: {result.false_count}, Ignore: {result.ignore_count} ({result.samples} samples)")
 
         predefined_rules = load_predefined_rules()
         print("Predefined Rules:")
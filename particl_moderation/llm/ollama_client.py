@@ -0,0 +1,229 @@
+import threading
+import time
+import requests
+
+from typing import Any, Dict, List, Optional, Set, Tuple
+from requests.adapters import HTTPAdapter
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+
+DEFAULT_OLLAMA_URL = "http://127.0.0.1:11434"
+
+class OllamaError(Exception):
+    """Error reported by the Ollama server for a request"""
+
+class OllamaUnavailableError(OllamaError):
+    """Raised when the Ollama server can't be reached and `ollama run` should be used instead"""
+
+class Endpoint:
+    """One Ollama server of the pool, with its routing weight and health"""
+    def __init__(self, url: str, weight: float = 1.0):
+        self.url = url.rstrip('/')
+        self.weight = max(float(weight), 0.01)
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejected = False
+        self.next_probe = 0.0
+
+    def load(self) -> float:
+        return (self.in_flight + 1) / self.weight
+
+class OllamaClient:
+    """HTTP client for one or more Ollama servers.
+
+    Each request goes to the healthy endpoint with the least requests in
+    flight relative to its weight. An endpoint that fails `eject_after`
+    requests in a row (connection errors or timeouts) is taken out of the
+    rotation and probed with GET /api/tags every `probe_interval` seconds
+    until it answers again. Requests that hit an unreachable endpoint are
+    retried on the others.
+    """
+    def __init__(self, base_url: str = DEFAULT_OLLAMA_URL, keep_alive: str = "30m", timeout: float = 120,
+                 pool_size: int = 4, endpoints: Optional[List[Tuple[str, float]]] = None, eject_after: int = 2,
+                 probe_interval: float = 30):
+        self.endpoints = [Endpoint(url, weight) for url, weight in (endpoints or [(base_url, 1.0)])]
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.eject_after = max(1, eject_after)
+        self.probe_interval = probe_interval
+        # Reuse connections to the servers across calls instead of paying
+        # process start-up and a new connection for every sample.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._endpoints_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_eval_count": 0, "prompt_eval_duration": 0, "eval_count": 0, "eval_duration": 0}
+
+    @property
+    def base_url(self) -> str:
+        return self.endpoints[0].url
+
+    def _probe(self, endpoint: Endpoint) -> None:
+        try:
+            healthy = self.session.get(f"{endpoint.url}/api/tags", timeout=min(self.timeout, 5)).status_code == 200
+        except (requests.ConnectionError, requests.Timeout):
+            healthy = False
+        with self._endpoints_lock:
+            if healthy:
+                endpoint.ejected = False
+                endpoint.failures = 0
+            else:
+                endpoint.next_probe = time.monotonic() + self.probe_interval
+
+    def _acquire(self, tried: Set[str]) -> Optional[Endpoint]:
+        """Pick the least loaded healthy endpoint not tried yet and count the request against it"""
+        now = time.monotonic()
+        to_probe = []
+        with self._endpoints_lock:
+            for endpoint in self.endpoints:
+                if endpoint.ejected and endpoint.next_probe <= now:
+                    # Only one thread probes an endpoint per interval
+                    endpoint.next_probe = now + self.probe_interval
+                    to_probe.append(endpoint)
+        for endpoint in to_probe:
+            self._probe(endpoint)
+
+        with self._endpoints_lock:
+            candidates = [e for e in self.endpoints if not e.ejected and e.url not in tried]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=Endpoint.load)
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, reachable: bool) -> None:
+        with self._endpoints_lock:
+            endpoint.in_flight -= 1
+            if reachable:
+                endpoint.requests += 1
+                endpoint.failures = 0
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.eject_after and not endpoint.ejected:
+                endpoint.ejected = True
+                endpoint.next_probe = time.monotonic() + self.probe_interval
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        tried: Set[str] = set()
+        errors = []
+        response: Optional[requests.Response] = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                if response is not None:
+                    # Every server answered with a server error, report the last one
+                    break
+                detail = "; ".join(errors) if errors else "all endpoints are ejected"
+                raise OllamaUnavailableError(f"Could not reach Ollama: {detail}")
+            tried.add(endpoint.url)
+            try:
+                response = self.session.post(f"{endpoint.url}{path}", json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(endpoint, reachable=False)
+                errors.append(f"{endpoint.url}: {e}")
+                continue
+            if response.status_code >= 500:
+                # A server answering with errors counts towards ejection like an unreachable one
+                self._release(endpoint, reachable=False)
+                errors.append(f"{endpoint.url}: HTTP {response.status_code}")
+                continue
+            self._release(endpoint, reachable=True)
+            break
+
+        try:
+            data = response.json()
+        except ValueError:
+            raise OllamaError(f"Unexpected HTTP {response.status_code} response from Ollama")
+
+        if response.status_code != 200 or "error" in data:
+            raise OllamaError(data.get("error", f"HTTP {response.status_code}"))
+
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            for key in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration"):
+                self.stats[key] += int(data.get(key) or 0)
+        return data
+
+    def stats_summary(self) -> Optional[str]:
+        """Average prompt evaluation cost per request, to check how much of the prompt is reused"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        if not stats["requests"]:
+            return None
+        requests_made = stats["requests"]
+        return (f"Ollama: {requests_made} requests, "
+                f"{stats['prompt_eval_count'] / requests_made:.0f} prompt tokens evaluated "
+                f"in {stats['prompt_eval_duration'] / requests_made / 1e6:.0f} ms per request, "
+                f"{stats['eval_duration'] / requests_made / 1e6:.0f} ms generating"
+                + self._endpoints_summary())
+
+    def _endpoints_summary(self) -> str:
+        if len(self.endpoints) == 1:
+            return ""
+        with self._endpoints_lock:
+            parts = [f"{e.url}: {e.requests}{' (ejected)' if e.ejected else ''}" for e in self.endpoints]
+        return f" [{', '.join(parts)}]"
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None, **extra: Any) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": options or {},
+        }
+        payload.update(extra)
+        return self._post("/api/generate", payload)
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None, **extra: Any) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": options or {},
+        }
+        payload.update(extra)
+        return self._post("/api/chat", payload)
+
+    def embed(self, model: str, inputs: List[str]) -> List[List[float]]:
+        payload = {"model": model, "input": inputs, "keep_alive": self.keep_alive}
+        return self._post("/api/embed", payload).get("embeddings", [])
+
+def get_endpoints() -> List[Tuple[str, float]]:
+    """(url, weight) of the configured Ollama servers: `llm.endpoints`, or just `llm.ollama_url`.
+
+    Entries of `llm.endpoints` are either a URL or {"url": ..., "weight": ...}.
+    """
+    endpoints = []
+    for entry in get_config("llm.endpoints", []) or []:
+        if isinstance(entry, str):
+            endpoints.append((entry, 1.0))
+        elif isinstance(entry, dict) and entry.get("url"):
+            endpoints.append((entry["url"], float(entry.get("weight", 1.0))))
+    return endpoints or [(get_config("llm.ollama_url", DEFAULT_OLLAMA_URL), 1.0)]
+
+@shared_instance
+def _load_ollama_client() -> OllamaClient:
+    endpoints = get_endpoints()
+    return OllamaClient(
+        keep_alive=get_config("llm.keep_alive", "30m"),
+        timeout=float(get_config("llm.request_timeout", 120)),
+        pool_size=max(1, int(get_config("llm.max_parallel", 4))) * len(endpoints),
+        endpoints=endpoints,
+        eject_after=int(get_config("llm.eject_after_failures", 2)),
+        probe_interval=float(get_config("llm.probe_interval", 30)),
+    )
+
+def get_ollama_client() -> Optional[OllamaClient]:
+    """Return the shared Ollama HTTP client, or None when `llm.use_api` is disabled"""
+    if not get_config("llm.use_api", True):
+        return None
+    return _load_ollama_client()
+
+def get_generation_options() -> Dict[str, Any]:
+    """Per-request model options (temperature, seed, num_predict, ...) from `llm.options`"""
+    return dict(get_config("llm.options", {}) or {})
@@ -0,0 +1,173 @@
+import re
+import threading
+
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.compiled_rules import CompiledRules, get_compiled_rules
+
+STOPWORDS = frozenset((
+    "a", "an", "and", "any", "are", "as", "at", "be", "but", "by", "for", "from", "in", "into", "is", "it",
+    "its", "not", "of", "on", "or", "other", "that", "the", "their", "them", "these", "this", "those", "to",
+    "with", "without", "general", "related", "services", "service", "content", "items", "item", "products",
+    "product", "material", "materials", "resources", "tools", "non", "over", "self", "use", "used",
+))
+
+# Longest first, stripped once; crude on purpose, a stem only has to be a prefix of the inflected forms
+SUFFIXES = ("ational", "ations", "ation", "ments", "ment", "ness", "ings", "ing", "ities", "ity", "ies",
+            "ied", "ers", "er", "ed", "es", "ly", "al", "ic", "s", "y", "e")
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+def stem(word: str, min_length: int = 4) -> str:
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_length:
+            return word[:-len(suffix)]
+    return word
+
+def normalize_words(text: str) -> str:
+    """Casefold and reduce to space-separated words, with spaces at both ends"""
+    return " " + " ".join(WORD_PATTERN.findall(text.casefold())) + " "
+
+class AhoCorasick:
+    """Multi-pattern substring matcher, one pass over the text for all patterns"""
+    def __init__(self, patterns: Set[str]):
+        # goto/fail/output tables of the trie, state 0 is the root
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+        for pattern in sorted(patterns):
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append(pattern)
+
+    def _build(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0) if self.goto[fallback].get(char) != child else 0
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def search(self, text: str) -> Iterator[Tuple[int, str]]:
+        """Yield (start index, pattern) for every occurrence"""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for pattern in self.output[state]:
+                yield i - len(pattern) + 1, pattern
+
+class Prefilter:
+    """Sends listings that share no word with any upvote/downvote rule term down a cheaper path.
+
+    Rule terms are split into words, stopwords dropped, and the remaining
+    words stemmed; an Aho-Corasick automaton then looks for those stems at
+    the start of any word of the normalised title and description. Listings
+    without a single hit are checked with a single LLM sample instead of the
+    full classification, and only marked 'ignore' if that sample agrees. The
+    stems only cover the words the rules spell out, so a listing that breaks
+    a rule with other words is still caught by that sample.
+    """
+    def __init__(self, min_stem_length: int = 4, extra_terms: Optional[List[str]] = None):
+        self.min_stem_length = min_stem_length
+        self.extra_terms = extra_terms or []
+        self._lock = threading.Lock()
+        self._digest: Optional[str] = None
+        self._automaton: Optional[AhoCorasick] = None
+        self.stats = {"screened": 0, "matched": 0, "checked": 0, "escalated": 0, "classified": 0, "classified_samples": 0}
+
+    def _stems(self, compiled_rules: CompiledRules) -> Set[str]:
+        terms = list(self.extra_terms)
+        for category in compiled_rules.rules.values():
+            for rule_type in ("downvote", "upvote"):
+                terms.extend(category.get(rule_type, []))
+
+        stems = set()
+        for term in terms:
+            for word in WORD_PATTERN.findall(term.casefold()):
+                if word not in STOPWORDS and len(word) >= 3:
+                    stems.add(stem(word, self.min_stem_length))
+        return stems
+
+    def _get_automaton(self) -> AhoCorasick:
+        compiled_rules = get_compiled_rules()
+        with self._lock:
+            if self._digest != compiled_rules.digest:
+                self._automaton = AhoCorasick(self._stems(compiled_rules))
+                self._digest = compiled_rules.digest
+            return self._automaton
+
+    def matches(self, title: str, description: str) -> List[str]:
+        text = normalize_words(f"{title} {description}")
+        # Only count hits that start at a word boundary
+        return sorted({pattern for start, pattern in self._get_automaton().search(text) if text[start - 1] == " "})
+
+    def screen(self, title: str, description: str) -> str:
+        """Return "match" (classify normally) or "check" (no rule term, a single sample decides whether to classify)"""
+        try:
+            matched = bool(self.matches(title, description))
+        except (OSError, ValueError):
+            # No usable rules file, leave it to the normal classification path
+            return "match"
+        with self._lock:
+            self.stats["screened"] += 1
+            if matched:
+                self.stats["matched"] += 1
+                return "match"
+            self.stats["checked"] += 1
+            return "check"
+
+    def record_check(self, escalated: bool) -> None:
+        if escalated:
+            with self._lock:
+                self.stats["escalated"] += 1
+
+    def record_classification(self, samples: int) -> None:
+        """Count the samples of a full classification, to estimate what a settled check saved"""
+        with self._lock:
+            self.stats["classified"] += 1
+            self.stats["classified_samples"] += samples
+
+    def stats_summary(self) -> Optional[str]:
+        with self._lock:
+            stats = dict(self.stats)
+        if not stats["screened"]:
+            return None
+        settled = stats["checked"] - stats["escalated"]
+        summary = (f"Prefilter: {stats['checked']} of {stats['screened']} listings matched no rule term and got a "
+                   f"single LLM sample; {settled} were settled by it and {stats['escalated']} got the full classification")
+        if settled and stats["classified"]:
+            # Each settled listing would have taken about as many samples as the classified ones did
+            average = stats["classified_samples"] / stats["classified"]
+            summary += f", about {settled * (average - 1):.0f} LLM calls avoided ({average:.1f} samples per classified listing)"
+        return summary
+
+@shared_instance
+def _load_prefilter() -> Prefilter:
+    return Prefilter(
+        min_stem_length=int(get_config("prefilter.min_stem_length", 4)),
+        extra_terms=list(get_config("prefilter.extra_terms", []) or []),
+    )
+
+def get_prefilter() -> Optional[Prefilter]:
+    """Return the shared prefilter, or None unless `prefilter.enabled` is set"""
+    if not get_config("prefilter.enabled", False):
+        return None
+    return _load_prefilter()
@@ -0,0 +1,127 @@
+import os
+import threading
+
+from typing import List, Optional, Tuple
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.compiled_rules import CompiledRules, get_compiled_rules
+from particl_moderation.llm.embedding_index import embed_listing, embed_texts, get_embedding_model
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+console = Console()
+
+class RuleSelector:
+    """Picks the rule categories relevant to a listing, so the prompt only carries those.
+
+    Every upvote/downvote/ignore term is embedded once per rules digest and
+    embedding model; the matrix is kept in `matrix_path` so it survives
+    restarts. A listing is scored against all terms with one matrix-vector
+    product and each category gets its best term's similarity. The
+    `top_k` best categories are used, unless even the best one is below
+    `min_similarity`, in which case the full rules are sent.
+    """
+    def __init__(self, matrix_path: str, top_k: int = 2, min_similarity: float = 0.35):
+        self.matrix_path = matrix_path
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._key: Optional[Tuple[str, str]] = None
+        self._matrix = None
+        self._term_categories = None
+        self._categories: List[str] = []
+        self.stats = {"selected": 0, "full": 0}
+
+    def _build(self, compiled_rules: CompiledRules, model: str) -> bool:
+        categories = list(compiled_rules.rules)
+        terms, term_categories = [], []
+        for index, name in enumerate(categories):
+            for rule_type in ("downvote", "upvote", "ignore"):
+                for term in compiled_rules.rules[name].get(rule_type, []):
+                    terms.append(term)
+                    term_categories.append(index)
+
+        if os.path.exists(self.matrix_path):
+            try:
+                stored = np.load(self.matrix_path)
+                if str(stored["digest"]) == compiled_rules.digest and str(stored["model"]) == model:
+                    self._set(stored["matrix"], stored["term_categories"], categories)
+                    return True
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if not terms:
+            return False
+        matrix = embed_texts(terms)
+        if matrix is None:
+            return False
+        term_categories = np.asarray(term_categories, dtype=np.int32)
+        try:
+            with open(self.matrix_path, 'wb') as f:
+                np.savez(f, digest=compiled_rules.digest, model=model, matrix=matrix, term_categories=term_categories)
+        except OSError as e:
+            console.print(f"[yellow]Could not save rule term embeddings: {str(e)}[/yellow]")
+        self._set(matrix, term_categories, categories)
+        return True
+
+    def _set(self, matrix, term_categories, categories: List[str]) -> None:
+        self._matrix = matrix
+        self._term_categories = term_categories
+        self._categories = categories
+
+    def select(self, title: str, description: str) -> Optional[Tuple[str, ...]]:
+        """Return the categories to put in the prompt, or None for the full rules"""
+        try:
+            compiled_rules = get_compiled_rules()
+        except (OSError, ValueError):
+            return None
+        key = (compiled_rules.digest, get_embedding_model())
+        with self._lock:
+            if self._key != key:
+                if not self._build(compiled_rules, key[1]):
+                    return None
+                self._key = key
+            matrix, term_categories, categories = self._matrix, self._term_categories, self._categories
+
+        if len(categories) <= self.top_k:
+            return None
+        query = embed_listing(title, description)
+        if query is None or query.shape[0] != matrix.shape[1]:
+            return None
+
+        similarities = matrix @ query
+        scores = np.full(len(categories), -1.0, dtype=np.float32)
+        np.maximum.at(scores, term_categories, similarities)
+        best = np.argsort(-scores)[:self.top_k]
+        with self._lock:
+            if scores[best[0]] < self.min_similarity:
+                self.stats["full"] += 1
+                return None
+            self.stats["selected"] += 1
+        # In rules file order, so the same selection always renders the same prompt
+        return tuple(categories[i] for i in sorted(best))
+
+    def stats_summary(self) -> Optional[str]:
+        total = self.stats["selected"] + self.stats["full"]
+        if not total:
+            return None
+        return (f"Rule selection: {self.stats['selected']} of {total} listings were prompted with only "
+                f"their {self.top_k} most relevant categories")
+
+@shared_instance
+def _load_rule_selector() -> RuleSelector:
+    return RuleSelector(
+        get_config("paths.rule_embeddings_file", "rule_embeddings.npz"),
+        top_k=int(get_config("rule_selection.top_k", 2)),
+        min_similarity=float(get_config("rule_selection.min_similarity", 0.35)),
+    )
+
+def get_rule_selector() -> Optional[RuleSelector]:
+    """Return the shared selector, or None unless `rule_selection.enabled` is set and NumPy is installed"""
+    if not get_config("rule_selection.enabled", False) or np is None:
+        return None
+    return _load_rule_selector()
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from typing import Dict, Optional
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.persistence import open_sqlite
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.llm.decision import Verdict
+
+console = Console()
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', text).casefold().split())
+
+def verdict_cache_key(title: str, description: str, rules_digest: str, model: str) -> str:
+    """Key a verdict on what decides it: the listing text, the rules and the model"""
+    payload = json.dumps([normalize_text(title), normalize_text(description), rules_digest, model])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class VerdictCache:
+    """Disk-backed LRU cache of classification verdicts with a time to live.
+
+    Relisted items come back with a new listing hash but the same text, so
+    their verdict can be reused instead of sampling the model again. Entries
+    older than `ttl` seconds are dropped on lookup, and once the cache holds
+    more than `max_entries` the least recently used ones are evicted.
+    """
+    def __init__(self, db_path: str, max_entries: int = 100_000, ttl: float = 30 * 86400):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.conn = open_sqlite(db_path,
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, "
+            "label TEXT NOT NULL, "
+            "true_count INTEGER NOT NULL, "
+            "false_count INTEGER NOT NULL, "
+            "ignore_count INTEGER NOT NULL, "
+            "samples INTEGER NOT NULL, "
+            "rule TEXT NOT NULL, "
+            "created REAL NOT NULL, "
+            "last_used REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used);"
+        )
+
+    def get(self, key: str) -> Optional[Verdict]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT label, true_count, false_count, ignore_count, samples, rule, created FROM verdicts WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or (self.ttl and now - row[6] > self.ttl):
+                if row is not None:
+                    self.conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return Verdict(*row[:6])
+
+    def put(self, key: str, verdict: Verdict) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, verdict.label, verdict.true_count, verdict.false_count, verdict.ignore_count,
+                 verdict.samples, verdict.rule, now, now)
+            )
+            excess = self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+
+    def clear(self) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM verdicts")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+@shared_instance
+def _load_verdict_cache() -> Optional[VerdictCache]:
+    try:
+        return VerdictCache(
+            get_config("paths.verdict_cache_file", "verdict_cache.db"),
+            max_entries=int(get_config("verdict_cache.max_entries", 100_000)),
+            ttl=float(get_config("verdict_cache.ttl_days", 30)) * 86400,
+        )
+    except sqlite3.Error as e:
+        console.print(f"[yellow]Verdict cache unavailable: {str(e)}[/yellow]")
+        return None
+
+def get_verdict_cache() -> Optional[VerdictCache]:
+    """Return the process-wide verdict cache, or None when `verdict_cache.enabled` is off"""
+    if not get_config("verdict_cache.enabled", True):
+        return None
+    return _load_verdict_cache()
@@ -0,0 +1,78 @@
+import json
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+from particl_moderation.utils.config import get_full_path
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.particl.inbox import InboxState
+
+PROPOSAL_ACTION_TYPE = "MPA_PROPOSAL_ADD"
+
+class ProposalIndex(InboxState):
+    """Oldest MPA_PROPOSAL_ADD action per target listing hash, persisted between runs.
+
+    Built from the whole proposal inbox once, then kept up to date from the
+    messages received since the last update (tracked by an InboxWatermark),
+    so looking up a listing's proposal no longer needs an inbox scan.
+    """
+    description = "proposal index"
+
+    def __init__(self, path: str, watermark_path: str):
+        # target -> (received, proposal action)
+        self.proposals: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        super().__init__(path, watermark_path)
+
+    def from_json(self, data: Any) -> None:
+        self.proposals = {target: (int(received), action) for target, (received, action) in data.items()}
+
+    def to_json(self) -> Any:
+        return {target: [received, action] for target, (received, action) in self.proposals.items()}
+
+    def clear(self) -> None:
+        self.proposals = {}
+
+    def __len__(self) -> int:
+        return len(self.proposals)
+
+    def get(self, target: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.proposals.get(target)
+        return entry[1] if entry else None
+
+    def add(self, action: Dict[str, Any], received: int) -> bool:
+        """Record a proposal action, keeping the oldest one per target. Returns True if it was kept"""
+        target = action.get('target')
+        if not target or not action.get('hash'):
+            return False
+        with self._lock:
+            current = self.proposals.get(target)
+            if current and current[0] <= received:
+                return False
+            self.proposals[target] = (received, action)
+            return True
+
+    def add_message(self, smsg: Dict[str, Any]) -> None:
+        raw_text = smsg.get('text', '')
+        if PROPOSAL_ACTION_TYPE not in raw_text:
+            return
+        try:
+            action = json.loads(raw_text)['action']
+        except (ValueError, KeyError, TypeError):
+            return
+        if isinstance(action, dict) and action.get('type') == PROPOSAL_ACTION_TYPE:
+            self.add(action, int(smsg.get('received', 0)))
+
+    def update(self, messages: Iterable[Dict[str, Any]]) -> int:
+        """Index the messages above the watermark and advance it. Returns how many were new"""
+        count = 0
+        for smsg in self.watermark.new_messages(messages):
+            self.add_message(smsg)
+            self.watermark.advance(smsg)
+            count += 1
+        return count
+
+@shared_instance
+def get_proposal_index() -> ProposalIndex:
+    return ProposalIndex(
+        get_full_path("paths.proposal_index_file"),
+        get_full_path("paths.proposal_watermark_file"),
+    )
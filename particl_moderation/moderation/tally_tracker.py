@@ -0,0 +1,114 @@
+import json
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from particl_moderation.utils.config import get_full_path
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.particl.inbox import InboxState
+
+VOTE_ACTION_TYPE = "MPA_VOTE"
+
+# (proposal hash, option hash, voter, signature, received)
+VoteMessage = Tuple[str, str, str, str, int]
+
+class TallyTracker(InboxState):
+    """Latest verified MPA_VOTE of every voter on every proposal, persisted between runs.
+
+    New vote messages are read incrementally above an InboxWatermark. Their
+    signatures are checked in one batch through the `verify` callback before
+    they count, and a voter's later vote replaces the earlier one, like the
+    market does when tallying.
+    """
+    description = "vote tally"
+
+    def __init__(self, path: str, watermark_path: str):
+        # proposal hash -> voter -> (option hash, received)
+        self.votes: Dict[str, Dict[str, Tuple[str, int]]] = {}
+        super().__init__(path, watermark_path)
+
+    def from_json(self, data: Any) -> None:
+        self.votes = {
+            proposal: {voter: (option, int(received)) for voter, (option, received) in voters.items()}
+            for proposal, voters in data.items()
+        }
+
+    def to_json(self) -> Any:
+        return {
+            proposal: {voter: [option, received] for voter, (option, received) in voters.items()}
+            for proposal, voters in self.votes.items()
+        }
+
+    def clear(self) -> None:
+        self.votes = {}
+
+    @staticmethod
+    def parse_vote(smsg: Dict[str, Any]) -> Optional[VoteMessage]:
+        raw_text = smsg.get('text', '')
+        if VOTE_ACTION_TYPE not in raw_text:
+            return None
+        try:
+            action = json.loads(raw_text)['action']
+            if action.get('type') != VOTE_ACTION_TYPE:
+                return None
+            return (action['proposalHash'], action['proposalOptionHash'], action['voter'], action['signature'],
+                    int(smsg.get('received', 0)))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def add(self, proposal_hash: str, option_hash: str, voter: str, received: int) -> None:
+        with self._lock:
+            voters = self.votes.setdefault(proposal_hash, {})
+            current = voters.get(voter)
+            if current is None or current[1] <= received:
+                voters[voter] = (option_hash, received)
+
+    def update(self, messages: Iterable[Dict[str, Any]], verify: Callable[[List[VoteMessage]], List[bool]]) -> Tuple[int, int]:
+        """Count the vote messages above the watermark whose signature verifies.
+
+        Returns (new votes, votes rejected for a bad signature). If reading the
+        messages fails, the votes read up to then still count before the error
+        is raised, since the watermark has already moved past them.
+        """
+        new_votes: List[VoteMessage] = []
+        valid: List[bool] = []
+        try:
+            for smsg in self.watermark.new_messages(messages):
+                vote = self.parse_vote(smsg)
+                if vote:
+                    new_votes.append(vote)
+                self.watermark.advance(smsg)
+        finally:
+            valid = verify(new_votes) if new_votes else []
+            for vote, ok in zip(new_votes, valid):
+                if ok:
+                    self.add(vote[0], vote[1], vote[2], vote[4])
+        return len(new_votes), sum(1 for ok in valid if not ok)
+
+    def voters(self, proposal_hash: str) -> Set[str]:
+        with self._lock:
+            return set(self.votes.get(proposal_hash, {}))
+
+    def tally(self, proposal_hash: str, weights: Dict[str, float], exclude: Iterable[str] = ()) -> Dict[str, float]:
+        """Weight per option hash of the current votes, leaving out the voters in `exclude`"""
+        excluded = set(exclude)
+        totals: Dict[str, float] = {}
+        with self._lock:
+            voters = dict(self.votes.get(proposal_hash, {}))
+        for voter, (option_hash, _) in voters.items():
+            if voter not in excluded:
+                totals[option_hash] = totals.get(option_hash, 0.0) + weights.get(voter, 0.0)
+        return totals
+
+def settled_option(totals: Dict[str, float], option_hashes: Iterable[str], remaining_weight: float) -> Optional[str]:
+    """The option that wins whatever `remaining_weight` votes for, or None if the outcome is still open"""
+    ranked = sorted(((totals.get(option, 0.0), option) for option in option_hashes), reverse=True)
+    if len(ranked) < 2:
+        return None
+    (leading_weight, leader), (runner_up_weight, _) = ranked[0], ranked[1]
+    return leader if leading_weight - runner_up_weight > remaining_weight else None
+
+@shared_instance
+def get_tally_tracker() -> TallyTracker:
+    return TallyTracker(
+        get_full_path("paths.tally_file"),
+        get_full_path("paths.tally_watermark_file"),
+    )
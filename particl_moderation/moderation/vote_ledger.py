@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.persistence import open_sqlite
+from particl_moderation.utils.singleton import shared_instance
+
+console = Console()
+
+SIGNED = "signed"
+SENT = "sent"
+
+class VoteLedger:
+    """Durable record of the votes signed and sent, keyed by (proposal, option, voter).
+
+    A vote is written as `signed` with its signature as soon as it is signed
+    and moved to `sent` once smsgsend accepted it. After a crash or an
+    interrupt only the votes that aren't `sent` go out again, and signed ones
+    reuse their stored signature. Votes not touched for `max_age` seconds,
+    and the least recently updated ones beyond `max_entries`, are dropped
+    when the ledger is opened and whenever votes are sent.
+    """
+    def __init__(self, db_path: str, max_age: float = 90 * 86400, max_entries: int = 100_000):
+        self.db_path = db_path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.conn = open_sqlite(db_path,
+            "CREATE TABLE IF NOT EXISTS votes ("
+            "proposal_hash TEXT NOT NULL, "
+            "option_hash TEXT NOT NULL, "
+            "voter TEXT NOT NULL, "
+            "signature TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "updated REAL NOT NULL, "
+            "PRIMARY KEY (proposal_hash, option_hash, voter));"
+            "CREATE INDEX IF NOT EXISTS votes_updated ON votes (updated);"
+        )
+        with self._lock:
+            self._prune()
+
+    def _prune(self) -> None:
+        """Drop expired votes and the oldest ones over `max_entries`, called with the lock held"""
+        if self.max_age:
+            self.conn.execute("DELETE FROM votes WHERE updated < ?", (time.time() - self.max_age,))
+        if self.max_entries:
+            excess = self.conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM votes WHERE rowid IN (SELECT rowid FROM votes ORDER BY updated LIMIT ?)",
+                    (excess,)
+                )
+
+    def votes(self, proposal_hash: str, option_hash: str) -> Dict[str, Tuple[str, str]]:
+        """voter -> (status, signature) of the votes recorded for an option"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT voter, status, signature FROM votes WHERE proposal_hash = ? AND option_hash = ?",
+                (proposal_hash, option_hash)
+            ).fetchall()
+        return {voter: (status, signature) for voter, status, signature in rows}
+
+    def record_signed(self, proposal_hash: str, option_hash: str, signatures: Dict[str, str]) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            # Never downgrade a vote that already went out
+            self.conn.executemany(
+                "INSERT INTO votes VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (proposal_hash, option_hash, voter) DO UPDATE SET "
+                "signature = excluded.signature, updated = excluded.updated WHERE status != 'sent'",
+                [(proposal_hash, option_hash, voter, signature, SIGNED, now) for voter, signature in signatures.items()]
+            )
+            self.conn.execute("COMMIT")
+
+    def record_sent(self, proposal_hash: str, option_hash: str, voters: Iterable[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE votes SET status = ?, updated = ? WHERE proposal_hash = ? AND option_hash = ? AND voter = ?",
+                [(SENT, now, proposal_hash, option_hash, voter) for voter in voters]
+            )
+            self._prune()
+            self.conn.execute("COMMIT")
+
+    def missing(self, proposal_hash: str, option_hash: str, voters: Iterable[str]) -> List[str]:
+        """The voters whose current vote on the proposal isn't a sent vote for this option.
+
+        Only a voter's most recently sent vote on a proposal counts, so a
+        listing flipping back to an earlier verdict is voted on again.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT voter, option_hash FROM votes WHERE proposal_hash = ? AND status = ? ORDER BY updated",
+                (proposal_hash, SENT)
+            ).fetchall()
+        current = dict(rows)
+        return [voter for voter in voters if current.get(voter) != option_hash]
+
+@shared_instance
+def get_vote_ledger() -> Optional[VoteLedger]:
+    """Return the process-wide vote ledger, or None if its database can't be opened"""
+    try:
+        return VoteLedger(
+            get_config("paths.vote_ledger_file", "vote_ledger.db"),
+            max_age=float(get_config("vote_ledger.max_age_days", 90)) * 86400,
+            max_entries=int(get_config("vote_ledger.max_entries", 100_000)),
+        )
+    except sqlite3.Error as e:
+        console.print(f"[yellow]Vote ledger unavailable: {str(e)}[/yellow]")
+        return None
@@ -3,16 +3,26 @@ import shlex
 import subprocess
 import os
 import hashlib
+import math
+import time
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
 from particl_moderation.utils.config import get_config, get_full_path
 from particl_moderation.utils.platform_compat import run_command, is_windows
 from particl_moderation.utils.log import log_marketplace_action
+from particl_moderation.utils.error_handler import as_completed_interruptible
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.particl.inbox import INBOX_READ_ERRORS, iter_json_array_items
+from particl_moderation.particl.rpc import rpc_command, rpc_batch, rpc_stream, ParticlRPCError, RPCUnavailableError
+from particl_moderation.moderation.proposal_index import PROPOSAL_ACTION_TYPE, ProposalIndex, get_proposal_index
+from particl_moderation.moderation.tally_tracker import VOTE_ACTION_TYPE, TallyTracker, VoteMessage, get_tally_tracker, settled_option
+from particl_moderation.moderation.vote_ledger import get_vote_ledger
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
-from rich.syntax import Syntax
 
 console = Console()
 
@@ -25,13 +35,19 @@ def log(message: str, style: str = ""):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     console.print(f"[cyan][{timestamp}][/cyan] {message}", style=style)
 
-def log_json(data: Any):
-    json_str = json.dumps(data, indent=2)
-    syntax = Syntax(json_str, "json", theme="monokai", line_numbers=True)
-    console.print(syntax)
-
 def execute_particl_cli(command: str) -> Optional[str]:
-    """Execute Particl CLI command using the path from config"""
+    """Execute Particl command over RPC, falling back to the CLI path from config"""
+    # Get wallet from config
+    active_wallet = get_config("particl.active_wallet")
+    if not active_wallet:
+        log("[red]No active wallet configured in config.[/red]")
+        return None
+
+    try:
+        return rpc_command(shlex.split(command), active_wallet) or None
+    except RPCUnavailableError:
+        pass
+
     if not PARTICL_CLI:
         log("Error: Particl CLI path not configured.", style="bold red")
         return None
@@ -40,12 +56,6 @@ def execute_particl_cli(command: str) -> Optional[str]:
         log(f"Error: Particl CLI not found at configured path: {PARTICL_CLI}", style="bold red")
         return None
 
-    # Get wallet from config
-    active_wallet = get_config("particl.active_wallet")
-    if not active_wallet:
-        log("[red]No active wallet configured in config.[/red]")
-        return None
-
     try:
         if is_windows():
             cli_path = os.path.normpath(PARTICL_CLI)
@@ -143,44 +153,128 @@ def read_vote_queue() -> List[List[str]]:
     
     return queue
 
-def get_existing_proposals(listing_hash: str) -> Optional[Dict[str, Any]]:
-   
-    command = 'smsginbox all "MPA_PROPOSAL_ADD"'
-    result = execute_particl_cli(command)
-   
-    if not result:
-        log(f"[yellow]No proposal messages found[/yellow]")
+def stream_inbox(mode: str, action_type: str) -> Optional[Iterable[str]]:
+    """Read `smsginbox <mode> <action_type>` as text chunks, streamed over RPC when available"""
+    active_wallet = get_config("particl.active_wallet")
+    try:
+        return rpc_stream(["smsginbox", mode, action_type], active_wallet)
+    except RPCUnavailableError:
+        pass
+    except ParticlRPCError as e:
+        log(f"[bold red]Error reading SMSG inbox: {e}[/bold red]")
         return None
-   
+    result = execute_particl_cli(f'smsginbox {mode} "{action_type}"')
+    return [result] if result else None
+
+def refresh_proposal_index() -> ProposalIndex:
+    """Bring the proposal index up to date with the proposals received since the last refresh"""
+    index = get_proposal_index()
+    # The first build (or the one after a failed read) reads every proposal, afterwards only the unread ones
+    chunks = stream_inbox(index.watermark.start_read(), PROPOSAL_ACTION_TYPE)
+    if chunks is None:
+        log("[yellow]Could not read proposal messages, using the proposal index as it is[/yellow]")
+        return index
+
     try:
-        data = json.loads(result)
-        messages = data.get('messages', [])
-        valid_proposals = []
-       
-        for msg in messages:
-            try:
-                text = msg.get('text', '')
-                text_data = json.loads(text)
-                # Check if this proposal's target matches our listing hash
-                if (text_data['action']['type'] == 'MPA_PROPOSAL_ADD' and
-                    text_data['action']['target'] == listing_hash):  # Changed from title to target
-                    received = int(msg.get('received', 0))
-                    valid_proposals.append((received, text_data['action']))
-            except (json.JSONDecodeError, KeyError):
-                continue
+        new_count = index.update(iter_json_array_items(chunks, "messages"))
+        index.watermark.rescan = False
+    except INBOX_READ_ERRORS as e:
+        new_count = 0
+        index.watermark.rescan = True
+        log(f"[bold red]Reading proposal messages failed: {e}. The next refresh reads them all.[/bold red]")
+    index.save()
+    log(f"[cyan]Proposal index: {new_count} new proposal messages, {len(index)} listings with a proposal[/cyan]")
+    return index
+
+def verify_vote_signatures(votes: List[VoteMessage]) -> List[bool]:
+    """Check the signatures of vote messages, batched over RPC or one CLI call each"""
+    messages = [(voter, signature, build_vote_signature_message(proposal_hash, option_hash, voter))
+                for proposal_hash, option_hash, voter, signature, _ in votes]
+    try:
+        results = rpc_batch([("verifymessage", list(message)) for message in messages], get_config("particl.active_wallet"))
+        return [result is True and error is None for result, error in results]
+    except RPCUnavailableError:
+        return [execute_particl_cli(f'verifymessage "{voter}" "{signature}" {shlex.quote(message)}') == "true"
+                for voter, signature, message in messages]
+
+def refresh_tally_tracker() -> TallyTracker:
+    """Count the vote messages received since the last refresh"""
+    tracker = get_tally_tracker()
+    chunks = stream_inbox(tracker.watermark.start_read(), VOTE_ACTION_TYPE)
+    if chunks is None:
+        log("[yellow]Could not read vote messages, using the vote tally as it is[/yellow]")
+        return tracker
 
-        if not valid_proposals:
-            log(f"[yellow]No valid proposals found for listing hash: '{listing_hash}'[/yellow]")
+    try:
+        new_count, rejected = tracker.update(iter_json_array_items(chunks, "messages"), verify_vote_signatures)
+        tracker.watermark.rescan = False
+    except INBOX_READ_ERRORS as e:
+        new_count, rejected = 0, 0
+        tracker.watermark.rescan = True
+        log(f"[bold red]Reading vote messages failed: {e}. The next refresh reads them all.[/bold red]")
+    tracker.save()
+    log(f"[cyan]Vote tally: {new_count} new votes, {rejected} rejected for an invalid signature[/cyan]")
+    return tracker
+
+class VoterWeights:
+    """Balance of voting addresses in PART, looked up once per run with getaddressbalance.
+
+    getaddressbalance needs particld to run with -addressindex. An address
+    whose balance can't be looked up has no known weight, so any lookup that
+    includes it returns None rather than guessing.
+    """
+    def __init__(self):
+        self.balances: Dict[str, float] = {}
+        self.unavailable: Set[str] = set()
+        self.rpc_unavailable = False
+        self._warned = False
+
+    def get(self, addresses: Iterable[str]) -> Optional[Dict[str, float]]:
+        addresses = set(addresses)
+        missing = [address for address in addresses if address not in self.balances and address not in self.unavailable]
+        if missing and not self.rpc_unavailable:
+            try:
+                results = rpc_batch([("getaddressbalance", [{"addresses": [address]}]) for address in missing])
+            except RPCUnavailableError:
+                self.rpc_unavailable = True
+                results = []
+            for address, (result, error) in zip(missing, results):
+                if error or not isinstance(result, dict):
+                    self.unavailable.add(address)
+                else:
+                    self.balances[address] = int(result.get("balance", 0)) / 1e8
+        if self.rpc_unavailable or addresses & self.unavailable:
+            if not self._warned:
+                log("[yellow]Some address balances are unavailable (particld needs -addressindex), "
+                    "voting on those proposals without checking the tally[/yellow]")
+                self._warned = True
             return None
+        return {address: self.balances[address] for address in addresses}
 
-        oldest_proposal = sorted(valid_proposals, key=lambda x: x[0])[0][1]
-        log(f"[green]Found existing proposal for listing hash: '{listing_hash}'[/green]")
-        log(f"[bold cyan]Proposal hash: {oldest_proposal['hash']}[/bold cyan]")
-        return oldest_proposal
+def get_settled_option(tracker: TallyTracker, weights: VoterWeights, proposal: Dict[str, Any],
+                       own_addresses: List[str]) -> Optional[str]:
+    """The option hash the proposal ends up with no matter how our addresses vote, if any.
 
-    except json.JSONDecodeError:
-        log(f"[bold red]Error decoding JSON from smsginbox command[/bold red]")
+    Our own earlier votes are left out of the tally, since voting again
+    replaces them. Without every voter's balance the outcome counts as open.
+    """
+    voter_weights = weights.get(tracker.voters(proposal['hash']) | set(own_addresses))
+    if voter_weights is None:
         return None
+    totals = tracker.tally(proposal['hash'], voter_weights, exclude=own_addresses)
+    own_weight = sum(voter_weights[address] for address in set(own_addresses))
+    return settled_option(totals, [option['hash'] for option in proposal['options']], own_weight)
+
+def get_existing_proposals(listing_hash: str) -> Optional[Dict[str, Any]]:
+    """Oldest proposal targeting the listing, from the proposal index (see refresh_proposal_index)"""
+    proposal = get_proposal_index().get(listing_hash)
+    if not proposal:
+        log(f"[yellow]No valid proposals found for listing hash: '{listing_hash}'[/yellow]")
+        return None
+
+    log(f"[green]Found existing proposal for listing hash: '{listing_hash}'[/green]")
+    log(f"[bold cyan]Proposal hash: {proposal['hash']}[/bold cyan]")
+    return proposal
 
 def get_addresses_with_coins() -> List[Dict[str, Any]]:
     command = 'listunspent'
@@ -207,8 +301,11 @@ def get_addresses_with_coins() -> List[Dict[str, Any]]:
 def remove_from_queue(hash_to_remove: str):
     with open(VOTE_QUEUE_FILE, 'r', encoding='utf-8') as f:
         lines = f.readlines()
-    with open(VOTE_QUEUE_FILE, 'w', encoding='utf-8') as f:
+    # Replace the file in one step, so a crash can't leave a truncated queue behind
+    tmp_path = f"{VOTE_QUEUE_FILE}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         f.writelines(line for line in lines if not line.startswith(hash_to_remove))
+    os.replace(tmp_path, VOTE_QUEUE_FILE)
 
 def prepare_proposal_data(hash: str, title: str, description: str, market_address: str, action: str, submitter_address: str) -> Tuple[Optional[Dict[str, Any]], str, str, str]:
     if not submitter_address:
@@ -267,6 +364,10 @@ def send_proposal(proposal_data: Dict[str, Any], market_address: str) -> bool:
     result = execute_particl_cli(command)
     if result:
         log(f"[green]Proposal sent successfully. Transaction ID: {result}[/green]")
+        # Known right away, so later items and runs don't propose the listing again
+        index = get_proposal_index()
+        index.add(proposal_data['action'], int(time.time()))
+        index.save()
         # Log the proposal with the hash
         log_marketplace_action(
             proposal_data['action']['title'], 
@@ -275,7 +376,7 @@ def send_proposal(proposal_data: Dict[str, Any], market_address: str) -> bool:
         )
         return True
     return False
-def prepare_vote_data(proposal_hash: str, option_hash: str, submitter_address: str) -> Optional[Dict[str, Any]]:
+def build_vote_signature_message(proposal_hash: str, option_hash: str, submitter_address: str) -> str:
     vote_sig_msg = {
         "proposalHash": proposal_hash,
         "proposalOptionHash": option_hash,
@@ -286,15 +387,10 @@ def prepare_vote_data(proposal_hash: str, option_hash: str, submitter_address: s
     vote_sig_msg_str = json.dumps(vote_sig_msg, separators=(',', ':'), ensure_ascii=True)
     
     # Create bug string by splitting each character and sorting
-    bug_str = ','.join(sorted(vote_sig_msg_str))
-    
-    # Sign the message
-    signature = execute_particl_cli(f'signmessage "{submitter_address}" {shlex.quote(bug_str)}')
-    if not signature:
-        log("[bold red]Failed to sign message[/bold red]")
-        return None
+    return ','.join(sorted(vote_sig_msg_str))
 
-    vote_data = {
+def build_vote_data(proposal_hash: str, option_hash: str, signature: str, submitter_address: str) -> Dict[str, Any]:
+    return {
         "version": "3.3.1",
         "action": {
             "type": "MPA_VOTE",
@@ -305,10 +401,53 @@ def prepare_vote_data(proposal_hash: str, option_hash: str, submitter_address: s
         }
     }
 
-    log("[bold green]Prepared vote data:[/bold green]")
-    log_json(vote_data)
-
-    return vote_data
+def sign_messages(messages: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """Sign each address's message with batched signmessage calls (or one CLI call each),
+    returning the signature per address (None if signing failed)"""
+    signatures: Dict[str, Optional[str]] = {}
+    try:
+        results = rpc_batch([("signmessage", [address, message]) for address, message in messages.items()],
+                            get_config("particl.active_wallet"))
+        for address, (signature, error) in zip(messages, results):
+            if error or not signature:
+                log(f"[bold red]Failed to sign message for address {address}: {error or 'empty signature'}[/bold red]")
+            signatures[address] = signature if not error and signature else None
+    except RPCUnavailableError:
+        for address, message in messages.items():
+            signatures[address] = execute_particl_cli(f'signmessage "{address}" {shlex.quote(message)}')
+            if not signatures[address]:
+                log(f"[bold red]Failed to sign message for address {address}[/bold red]")
+    return signatures
+
+def prepare_vote_data_batch(proposal_hash: str, option_hash: str, addresses: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Sign the vote for every address with batched signmessage calls.
+
+    Signatures already in the vote ledger are reused: a vote signed by an
+    earlier run whose send didn't go through, or an option voted for before
+    the listing's verdict flipped, doesn't need signing again.
+    """
+    ledger = get_vote_ledger()
+    recorded = ledger.votes(proposal_hash, option_hash) if ledger else {}
+    signatures = {address: recorded[address][1] for address in addresses if address in recorded}
+    to_sign = [address for address in addresses if address not in signatures]
+    if to_sign:
+        new_signatures = sign_messages({
+            address: build_vote_signature_message(proposal_hash, option_hash, address) for address in to_sign
+        })
+        if ledger:
+            ledger.record_signed(proposal_hash, option_hash, {
+                address: signature for address, signature in new_signatures.items() if signature
+            })
+        signatures.update(new_signatures)
+
+    votes: Dict[str, Optional[Dict[str, Any]]] = {}
+    for address in addresses:
+        signature = signatures.get(address)
+        votes[address] = build_vote_data(proposal_hash, option_hash, signature, address) if signature else None
+
+    log(f"[bold green]Prepared {sum(1 for v in votes.values() if v)} of {len(addresses)} votes "
+        f"({len(addresses) - len(to_sign)} reused signatures)[/bold green]")
+    return votes
 
 def send_vote(vote_data: Dict[str, Any], submitter_address: str, market_address: str, title: str, action: str) -> bool:
     vote_json = json.dumps(vote_data, separators=(',', ':'))
@@ -321,6 +460,75 @@ def send_vote(vote_data: Dict[str, Any], submitter_address: str, market_address:
         return True
     return False
 
+def send_vote_batch(votes: Dict[str, Dict[str, Any]], market_address: str, title: str, action: str) -> Dict[str, bool]:
+    """Send the prepared votes using batched smsgsend calls, returning success per address"""
+    addresses = list(votes)
+    calls = [
+        ("smsgsend", [address, market_address, json.dumps(votes[address], separators=(',', ':')), False, 2])
+        for address in addresses
+    ]
+    try:
+        results = rpc_batch(calls, get_config("particl.active_wallet"))
+    except RPCUnavailableError:
+        return {address: send_vote(votes[address], address, market_address, title, action) for address in addresses}
+
+    sent: Dict[str, bool] = {}
+    for address, (result, error) in zip(addresses, results):
+        # smsgsend reports some failures in its result instead of an RPC error
+        if error or not result or (isinstance(result, dict) and result.get("error")):
+            reason = error or (result.get("error") if isinstance(result, dict) else "empty result")
+            log(f"[bold red]smsgsend failed for address {address}: {reason}[/bold red]")
+            sent[address] = False
+        else:
+            msgid = result.get("msgid", result) if isinstance(result, dict) else result
+            log(f"[green]Vote sent successfully. Transaction ID: {msgid}[/green]")
+            sent[address] = True
+    return sent
+
+def get_vote_workers() -> int:
+    return max(1, int(get_config("particl.vote_workers", 4)))
+
+@shared_instance
+def get_vote_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=get_vote_workers(), thread_name_prefix="vote")
+
+def _cast_vote_chunk(proposal_hash: str, option_hash: str, addresses: List[str], market_address: str,
+                     title: str, action: str) -> Dict[str, bool]:
+    votes = {}
+    for submitter_address, vote_data in prepare_vote_data_batch(proposal_hash, option_hash, addresses).items():
+        if not vote_data:
+            log(f"[bold red]Failed to prepare vote data for address {submitter_address}. Skipping this vote.[/bold red]")
+            continue
+        votes[submitter_address] = vote_data
+
+    sent = send_vote_batch(votes, market_address, title, action) if votes else {}
+    ledger = get_vote_ledger()
+    if ledger:
+        ledger.record_sent(proposal_hash, option_hash, [address for address, ok in sent.items() if ok])
+    return {address: sent.get(address, False) for address in addresses}
+
+def cast_votes(proposal_hash: str, option_hash: str, addresses: List[str], market_address: str,
+               title: str, action: str) -> Dict[str, bool]:
+    """Sign and send the vote of every address, returning success per address.
+
+    The addresses are split into one chunk per `particl.vote_workers` worker.
+    Each chunk is signed and then sent by a single worker, so every address
+    still signs before it sends.
+    """
+    if not addresses:
+        return {}
+    chunk_size = math.ceil(len(addresses) / get_vote_workers())
+    executor = get_vote_executor()
+    futures = [
+        executor.submit(_cast_vote_chunk, proposal_hash, option_hash, addresses[start:start + chunk_size],
+                        market_address, title, action)
+        for start in range(0, len(addresses), chunk_size)
+    ]
+    sent: Dict[str, bool] = {}
+    for future in as_completed_interruptible(futures):
+        sent.update(future.result())
+    return sent
+
 def verify_vote_data(vote_data: Dict[str, Any]) -> bool:
     required_fields = ['version', 'action']
     action_fields = ['type', 'proposalHash', 'proposalOptionHash', 'signature', 'voter']
@@ -356,7 +564,15 @@ def process_vote_queue():
         log("[bold red]No addresses with sufficient coins found. Cannot process votes.[/bold red]")
         return
 
-    for item in queue:
+    refresh_proposal_index()
+    tracker = refresh_tally_tracker() if get_config("tally.enabled", False) else None
+    weights = VoterWeights()
+    own_addresses = [address_info['address'] for address_info in addresses_with_coins]
+
+    # (item, deferred): settled items can be moved to the back so contested listings go first
+    pending = deque((item, False) for item in queue)
+    while pending:
+        item, deferred = pending.popleft()
         hash, title, description, market_address, action = item
 
         market_address = market_address if market_address and market_address != "null" else DEFAULT_MARKET_ADDRESS
@@ -373,6 +589,17 @@ def process_vote_queue():
             if not option_hash:
                 log(f"[bold red]Could not find matching option hash for action {action}. Skipping this item.[/bold red]")
                 continue
+
+            settled = get_settled_option(tracker, weights, existing_proposal, own_addresses) if tracker and not deferred else None
+            if settled:
+                outcome = "already decided this way" if settled == option_hash else "decided the other way"
+                if get_config("tally.settled_action", "skip") == "defer":
+                    log(f"[cyan]Proposal is {outcome} whatever our addresses vote, deferring it to the end of the queue.[/cyan]")
+                    pending.append((item, True))
+                else:
+                    log(f"[cyan]Proposal is {outcome} whatever our addresses vote, skipping it.[/cyan]")
+                    remove_from_queue(hash)
+                continue
         else:
             log(f"[bold yellow]No existing proposal found for '{title}'. Creating a new proposal.[/bold yellow]")
             submitter_address = addresses_with_coins[0]['address']  # Use the first address with coins
@@ -390,28 +617,38 @@ def process_vote_queue():
                 log(f"[bold red]Failed to send new proposal for '{title}'. Skipping this item.[/bold red]")
                 continue
 
-        for address_info in addresses_with_coins:
-            submitter_address = address_info['address']
-            vote_data = prepare_vote_data(proposal_hash, option_hash, submitter_address)
-
-            if not vote_data:
-                log(f"[bold red]Failed to prepare vote data for address {submitter_address}. Skipping this vote.[/bold red]")
-                continue
-
-            log(f"[yellow]Sending vote from address {submitter_address}...[/yellow]")
-            if send_vote(vote_data, submitter_address, market_address, title, action):
+        addresses = [address_info['address'] for address_info in addresses_with_coins]
+        ledger = get_vote_ledger()
+        already_sent = 0
+        if ledger:
+            already_sent = len(addresses)
+            addresses = ledger.missing(proposal_hash, option_hash, addresses)
+            already_sent -= len(addresses)
+            if already_sent:
+                log(f"[cyan]{already_sent} votes for this listing were already sent, skipping them.[/cyan]")
+
+        log(f"[yellow]Signing and sending {len(addresses)} votes...[/yellow]")
+        sent_votes = cast_votes(proposal_hash, option_hash, addresses, market_address, title, action)
+        for submitter_address in addresses:
+            if sent_votes.get(submitter_address):
                 log(f"[bold green]Vote sent successfully from address {submitter_address}[/bold green]")
-                # Only log the vote once per listing
-                if hash not in logged_votes:
-                    log_marketplace_action(
-                        title,
-                        "Upvote" if action.upper() == "KEEP" else "Downvote",
-                        hash
-                    )
-                    logged_votes.add(hash)
             else:
                 log(f"[bold red]Failed to send vote from address {submitter_address}[/bold red]")
 
+        failed = sum(1 for address in addresses if not sent_votes.get(address))
+        if failed and ledger:
+            # The ledger knows what went out, the next run only sends the rest
+            log(f"[yellow]{failed} votes failed, keeping the item in the queue to retry them: {hash}[/yellow]")
+            continue
+
+        # Only log the vote once per listing, when the item leaves the queue
+        if (already_sent or any(sent_votes.values())) and hash not in logged_votes:
+            log_marketplace_action(
+                title,
+                "Upvote" if action.upper() == "KEEP" else "Downvote",
+                hash
+            )
+            logged_votes.add(hash)
         remove_from_queue(hash)
         log(f"[green]Processed and removed item from queue: {hash}[/green]")
 
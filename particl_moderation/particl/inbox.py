@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import subprocess
+import threading
+import requests
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.persistence import read_json, write_json
+
+console = Console()
+
+# What reading an inbox reply can fail with half-way through the stream
+INBOX_READ_ERRORS = (requests.RequestException, subprocess.CalledProcessError, ValueError)
+
+class InboxWatermark:
+    """Persisted high-water mark of the newest SMSG inbox message already ingested.
+
+    The mark is the highest `received` timestamp seen plus the ids of the
+    messages received in that same second, so messages sharing a timestamp
+    with the mark are neither skipped nor ingested twice.
+
+    `rescan` is set while an `unread` read is under way and stays set if it
+    fails or the process dies half-way: the daemon marks messages read as
+    soon as it returns them, so only reading the whole inbox again can bring
+    back the ones that were never processed.
+    """
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.received = 0
+        self.msgids: List[str] = []
+        self.rescan = False
+        self.load()
+
+    def exists(self) -> bool:
+        return self.received > 0
+
+    def fetch_mode(self, full_scan: bool = False) -> str:
+        """smsginbox mode to read with: `all` for the first read, after a failed read or on request"""
+        if full_scan or self.rescan or not self.exists():
+            return "all"
+        return get_config("particl.inbox_fetch_mode", "unread")
+
+    def start_read(self, full_scan: bool = False) -> str:
+        """fetch_mode for a read that is about to start. Before an `unread` read,
+        `rescan` is saved as set; clear it once the read has completed"""
+        mode = self.fetch_mode(full_scan)
+        if mode != "all":
+            self.rescan = True
+            self.save_rescan()
+        return mode
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            data = read_json(self.path)
+            self.received = int(data.get("received", 0))
+            self.msgids = list(data.get("msgids", []))
+            self.rescan = bool(data.get("rescan", False))
+        except (OSError, ValueError, TypeError) as e:
+            console.print(f"[yellow]Could not read inbox watermark {self.path}: {e}. Starting from scratch.[/yellow]")
+            self.received = 0
+            self.msgids = []
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        try:
+            write_json(self.path, {"received": self.received, "msgids": self.msgids, "rescan": self.rescan})
+        except OSError as e:
+            console.print(f"[red]Error saving inbox watermark: {str(e)}[/red]")
+
+    def save_rescan(self) -> None:
+        """Save `rescan` alone, leaving the saved mark in step with any state saved along with it"""
+        if not self.path:
+            return
+        try:
+            data = read_json(self.path) if os.path.exists(self.path) else {}
+            data["rescan"] = self.rescan
+            write_json(self.path, data)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            console.print(f"[red]Error saving inbox watermark: {str(e)}[/red]")
+
+    def reset(self) -> None:
+        self.received = 0
+        self.msgids = []
+        self.rescan = False
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def is_new(self, smsg: Dict[str, Any]) -> bool:
+        received = int(smsg.get('received', 0))
+        if received != self.received:
+            return received > self.received
+        return smsg.get('msgid') not in self.msgids
+
+    def advance(self, smsg: Dict[str, Any]) -> None:
+        received = int(smsg.get('received', 0))
+        msgid = smsg.get('msgid', '')
+        if received > self.received:
+            self.received = received
+            self.msgids = [msgid]
+        elif received == self.received and msgid not in self.msgids:
+            self.msgids.append(msgid)
+
+    def new_messages(self, messages: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Lazily yield the messages above the mark as it was when iteration started.
+
+        The comparison uses a snapshot of the mark, so advancing it while the
+        messages are being consumed doesn't skip messages delivered out of order.
+        """
+        floor = InboxWatermark(None)
+        floor.received, floor.msgids = self.received, list(self.msgids)
+        return (smsg for smsg in messages if floor.is_new(smsg))
+
+class InboxState(ABC):
+    """State built from the inbox messages above an InboxWatermark, saved as JSON next to it.
+
+    Subclasses set up their empty state before calling this constructor and
+    convert it with `to_json` / `from_json`. Without a readable state file the
+    watermark is reset, since it would otherwise skip every message seen before.
+    """
+    description = "inbox state"
+
+    def __init__(self, path: str, watermark_path: str):
+        self.path = path
+        self.watermark = InboxWatermark(watermark_path)
+        self._lock = threading.Lock()
+        self.load()
+
+    @abstractmethod
+    def from_json(self, data: Any) -> None:
+        """Replace the state with the saved one, raising ValueError / TypeError if it is malformed"""
+
+    @abstractmethod
+    def to_json(self) -> Any:
+        """The state as JSON data, called with the lock held"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            self.watermark.reset()
+            return
+        try:
+            self.from_json(read_json(self.path))
+        except (OSError, ValueError, TypeError) as e:
+            console.print(f"[yellow]Could not read {self.description} {self.path}: {e}. Rebuilding it.[/yellow]")
+            self.clear()
+            self.watermark.reset()
+
+    def save(self) -> None:
+        with self._lock:
+            data = self.to_json()
+        try:
+            write_json(self.path, data, separators=(',', ':'))
+        except OSError as e:
+            console.print(f"[red]Error saving {self.description}: {str(e)}[/red]")
+            return
+        # Only move the watermark once the state it covers is on disk
+        self.watermark.save()
+
+def iter_json_array_items(chunks: Iterable[str], key: str = "messages") -> Iterator[Dict[str, Any]]:
+    """Incrementally decode the items of the first `key` array in a JSON text stream.
+
+    Only the item being decoded and the unread part of the current chunk are
+    held in memory, so an inbox reply of any size is yielded one message at a
+    time instead of being parsed as a single string. Raises ValueError if the
+    stream ends before the array does.
+    """
+    decoder = json.JSONDecoder()
+    key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    keep_tail = len(key) + 16
+    buffer = ""
+    in_array = False
+
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+
+        if not in_array:
+            match = key_pattern.search(buffer)
+            if not match:
+                # Keep enough of the tail in case the key straddles two chunks
+                buffer = buffer[-keep_tail:]
+                continue
+            in_array = True
+            pos = match.end()
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                item, pos_end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Item not complete yet, wait for the next chunk
+                break
+            pos = pos_end
+            yield item
+
+        buffer = buffer[pos:]
+
+    if in_array:
+        raise ValueError(f"Inbox reply ended before the end of the \"{key}\" array")
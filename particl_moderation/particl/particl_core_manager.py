@@ -9,6 +9,7 @@ import yaml
 from typing import Optional, List, Dict, Any
 from rich.console import Console
 from particl_moderation.utils.config import set_config
+from particl_moderation.particl.rpc import rpc_command, RPCUnavailableError
 from prompt_toolkit import prompt
 
 
@@ -301,6 +302,11 @@ class ParticlCoreManager:
                     console.print(f"[yellow]Warning: Could not remove temporary file {download_path}: {str(e)}[/yellow]")
 
     def _run_particl_command(self, command: List[str], wallet: str = None, silent: bool = False) -> Optional[str]:
+        try:
+            return rpc_command(command, wallet, silent=silent)
+        except RPCUnavailableError:
+            pass
+
         if not self.check_cli_path(silent=silent):
             if not silent:
                 console.print("[bold red]Particl Core is not properly installed.[/bold red]")
@@ -316,9 +322,10 @@ class ParticlCoreManager:
             result = subprocess.run(full_command, check=True, capture_output=True, text=True)
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
-            console.print(f"[bold red]Error running Particl command: {e}[/bold red]")
-            if e.stderr:
-                console.print(f"Details: {e.stderr}")
+            if not silent:
+                console.print(f"[bold red]Error running Particl command: {e}[/bold red]")
+                if e.stderr:
+                    console.print(f"Details: {e.stderr}")
             return None
         except OSError as e:
             if hasattr(e, 'winerror') and e.winerror == 193:  # Windows error for "not a valid Win32 application"
@@ -0,0 +1,306 @@
+import itertools
+import json
+import os
+import threading
+import requests
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from requests.adapters import HTTPAdapter
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+from particl_moderation.utils.platform_compat import get_particl_data_dir
+
+console = Console()
+
+DEFAULT_RPC_HOST = "127.0.0.1"
+DEFAULT_RPC_PORT = 51735
+
+# Positional indexes / named arguments that particl-cli parses as JSON before
+# sending them to the daemon. Everything else is passed through as a string,
+# exactly like the CLI does (see vRPCConvertParams in particl-core).
+CONVERT_PARAMS: Dict[str, set] = {
+    "createrawtransaction": {0, 1, 2, 3},
+    "createwallet": {1, 2, 4, 5, 6, "disable_private_keys", "blank", "avoid_reuse", "descriptors", "load_on_startup"},
+    "getbalance": {1, 2, 3},
+    "importprivkey": {2},
+    "listreceivedbyaddress": {0, 1, 2},
+    "listunspent": {0, 1, 2, 3, 4},
+    "sendtoaddress": {1, 4, 6, 7},
+    "signrawtransactionwithwallet": {1},
+    "smsg": {1},
+    "smsginbox": {2},
+    "smsgscanbuckets": {0},
+    "smsgsend": {3, 4, 5, 6, 7},
+}
+
+class ParticlRPCError(Exception):
+    """Error object returned by particld for a single RPC call"""
+    def __init__(self, code: int, message: str, method: str = ""):
+        super().__init__(f"{method}: {message} (code {code})" if method else f"{message} (code {code})")
+        self.code = code
+        self.message = message
+        self.method = method
+
+class RPCUnavailableError(Exception):
+    """Raised when particld can't be reached over JSON-RPC and the CLI should be used instead"""
+
+class ParticlRPC:
+    def __init__(self, host: str = DEFAULT_RPC_HOST, port: int = DEFAULT_RPC_PORT, user: str = "",
+                 password: str = "", cookie_file: str = "", timeout: float = 120, pool_size: int = 8,
+                 batch_size: int = 25):
+        self.url = f"http://{host}:{port}"
+        self.batch_size = max(1, batch_size)
+        self.user = user
+        self.password = password
+        self.cookie_file = cookie_file
+        self.timeout = timeout
+
+        # One session for the whole process: requests keeps the TCP connections
+        # to particld alive and hands them out from the adapter's pool.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self._auth: Optional[Tuple[str, str]] = None
+        self._auth_lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _read_cookie(self) -> Tuple[str, str]:
+        try:
+            with open(self.cookie_file, 'r') as f:
+                user, _, password = f.read().strip().partition(':')
+        except OSError as e:
+            raise RPCUnavailableError(f"Could not read RPC cookie file {self.cookie_file}: {e}")
+        return user, password
+
+    def _get_auth(self, refresh: bool = False) -> Tuple[str, str]:
+        with self._auth_lock:
+            if self._auth is None or refresh:
+                if self.user and self.password:
+                    self._auth = (self.user, self.password)
+                else:
+                    # The cookie is rewritten every time particld starts, so it is
+                    # only re-read when the daemon rejects the cached credentials.
+                    self._auth = self._read_cookie()
+            return self._auth
+
+    def _send(self, payload: Union[Dict[str, Any], List[Dict[str, Any]]], wallet: Optional[str] = None,
+              stream: bool = False) -> requests.Response:
+        url = self.url + (f"/wallet/{requests.utils.quote(wallet, safe='')}" if wallet else "/")
+        data = json.dumps(payload)
+
+        for attempt in range(2):
+            try:
+                response = self.session.post(url, data=data, auth=self._get_auth(refresh=attempt > 0),
+                                             timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise RPCUnavailableError(f"Could not connect to particld at {self.url}: {e}")
+
+            if response.status_code != 401:
+                return response
+
+            response.close()
+            if self.user and self.password:
+                break
+
+        raise RPCUnavailableError("RPC authentication with particld failed")
+
+    def _post(self, payload: Union[Dict[str, Any], List[Dict[str, Any]]], wallet: Optional[str] = None) -> Any:
+        response = self._send(payload, wallet)
+        # particld answers RPC errors with 404/500 and a JSON body, so the
+        # status code alone doesn't tell us whether the call failed.
+        try:
+            return response.json()
+        except ValueError:
+            raise RPCUnavailableError(f"Unexpected HTTP {response.status_code} response from particld")
+
+    def call(self, method: str, params: Union[List[Any], Dict[str, Any], None] = None, wallet: Optional[str] = None) -> Any:
+        payload = {
+            "jsonrpc": "1.0",
+            "id": next(self._ids),
+            "method": method,
+            "params": params if params is not None else [],
+        }
+        response = self._post(payload, wallet)
+        if not isinstance(response, dict):
+            raise RPCUnavailableError(f"Malformed RPC response for {method}")
+
+        error = response.get("error")
+        if error:
+            raise ParticlRPCError(error.get("code", -1), error.get("message", "Unknown error"), method)
+        return response.get("result")
+
+    def batch(self, calls: List[Tuple[str, List[Any]]], wallet: Optional[str] = None) -> List[Tuple[Any, Optional[ParticlRPCError]]]:
+        """Send several calls in one JSON-RPC batch array.
+
+        Returns one (result, error) pair per call, in the order the calls were
+        given, so a failure of one call doesn't hide the results of the others.
+        """
+        if not calls:
+            return []
+
+        # Ids only have to be unique within one HTTP exchange
+        payload = [
+            {"jsonrpc": "1.0", "id": idx, "method": method, "params": params}
+            for idx, (method, params) in enumerate(calls)
+        ]
+
+        response = self._post(payload, wallet)
+        if not isinstance(response, list):
+            # Older daemons answer a rejected batch with a single error object
+            error = response.get("error") if isinstance(response, dict) else None
+            if error:
+                err = ParticlRPCError(error.get("code", -1), error.get("message", "Unknown error"), "batch")
+                return [(None, err) for _ in calls]
+            raise RPCUnavailableError("Malformed RPC batch response")
+
+        # Batch replies may come back in any order, match them up by id
+        by_id = {item.get("id"): item for item in response if isinstance(item, dict)}
+        results: List[Tuple[Any, Optional[ParticlRPCError]]] = []
+        for idx, (method, _) in enumerate(calls):
+            item = by_id.get(idx)
+            if item is None:
+                results.append((None, ParticlRPCError(-1, "No response in batch", method)))
+            elif item.get("error"):
+                error = item["error"]
+                results.append((None, ParticlRPCError(error.get("code", -1), error.get("message", "Unknown error"), method)))
+            else:
+                results.append((item.get("result"), None))
+        return results
+
+    def stream(self, method: str, params: Union[List[Any], Dict[str, Any], None] = None,
+               wallet: Optional[str] = None, chunk_size: int = 65536) -> Iterator[str]:
+        """Issue a call and return the raw JSON-RPC reply as an iterator of text chunks.
+
+        Used for replies too large to hold in memory as one string; the caller
+        parses the chunks incrementally.
+        """
+        payload = {
+            "jsonrpc": "1.0",
+            "id": next(self._ids),
+            "method": method,
+            "params": params if params is not None else [],
+        }
+        response = self._send(payload, wallet, stream=True)
+        if response.status_code != 200:
+            # Error replies are small, read them whole
+            try:
+                error = response.json().get("error") or {}
+            except ValueError:
+                raise RPCUnavailableError(f"Unexpected HTTP {response.status_code} response from particld")
+            raise ParticlRPCError(error.get("code", -1), error.get("message", "Unknown error"), method)
+
+        response.encoding = 'utf-8'
+        return response.iter_content(chunk_size=chunk_size, decode_unicode=True)
+
+def get_cookie_file() -> str:
+    cookie_file = get_config("particl.rpc_cookie_file", "")
+    if cookie_file:
+        return cookie_file
+    data_dir = get_config("particl.data_dir", "") or get_particl_data_dir()
+    return os.path.join(data_dir, ".cookie")
+
+@shared_instance
+def _load_rpc_client() -> ParticlRPC:
+    return ParticlRPC(
+        host=get_config("particl.rpc_host", DEFAULT_RPC_HOST),
+        port=int(get_config("particl.rpc_port", DEFAULT_RPC_PORT)),
+        user=get_config("particl.rpc_user", ""),
+        password=get_config("particl.rpc_password", ""),
+        cookie_file=get_cookie_file(),
+        timeout=float(get_config("particl.rpc_timeout", 120)),
+        pool_size=int(get_config("particl.rpc_pool_size", 8)),
+        batch_size=int(get_config("particl.rpc_batch_size", 25)),
+    )
+
+def get_rpc_client() -> Optional[ParticlRPC]:
+    """Return the shared RPC client, or None when RPC is disabled in the config"""
+    if not get_config("particl.rpc_enabled", True):
+        return None
+    return _load_rpc_client()
+
+def _convert_param(method: str, key: Union[int, str], value: str) -> Any:
+    if key in CONVERT_PARAMS.get(method, ()):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def cli_args_to_params(command: List[str]) -> Tuple[str, Union[List[Any], Dict[str, Any]]]:
+    """Translate particl-cli style arguments into an RPC method and its params"""
+    args = list(command)
+    named = False
+    if args and args[0] == "-named":
+        named = True
+        args = args[1:]
+
+    if not args:
+        raise ValueError("No RPC method given")
+
+    method, raw_params = args[0], args[1:]
+    if named:
+        params: Dict[str, Any] = {}
+        for arg in raw_params:
+            key, _, value = arg.partition('=')
+            params[key] = _convert_param(method, key, value)
+        return method, params
+
+    return method, [_convert_param(method, idx, value) for idx, value in enumerate(raw_params)]
+
+def format_cli_output(result: Any) -> str:
+    """Render an RPC result the same way particl-cli prints it"""
+    if result is None:
+        return ""
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, indent=2)
+
+def rpc_command(command: List[str], wallet: Optional[str] = None, silent: bool = False) -> Optional[str]:
+    """Run a particl-cli style command over JSON-RPC.
+
+    Returns the output particl-cli would have printed, or None if the daemon
+    returned an error (printed unless `silent`). Raises RPCUnavailableError
+    when the caller should fall back to spawning particl-cli.
+    """
+    client = get_rpc_client()
+    if client is None:
+        raise RPCUnavailableError("RPC disabled in config")
+
+    method, params = cli_args_to_params(command)
+    try:
+        return format_cli_output(client.call(method, params, wallet=wallet))
+    except ParticlRPCError as e:
+        if not silent:
+            console.print(f"[bold red]Error running Particl command: {e}[/bold red]")
+        return None
+
+def rpc_stream(command: List[str], wallet: Optional[str] = None) -> Iterator[str]:
+    """Run a particl-cli style command over JSON-RPC and stream the raw reply.
+
+    Raises RPCUnavailableError when the caller should fall back to particl-cli
+    and ParticlRPCError when the daemon rejected the call.
+    """
+    client = get_rpc_client()
+    if client is None:
+        raise RPCUnavailableError("RPC disabled in config")
+
+    method, params = cli_args_to_params(command)
+    return client.stream(method, params, wallet=wallet)
+
+def rpc_batch(calls: List[Tuple[str, List[Any]]], wallet: Optional[str] = None) -> List[Tuple[Any, Optional[ParticlRPCError]]]:
+    """Run calls as JSON-RPC batches of at most `particl.rpc_batch_size` entries.
+
+    Raises RPCUnavailableError when the caller should fall back to one
+    particl-cli invocation per call.
+    """
+    client = get_rpc_client()
+    if client is None:
+        raise RPCUnavailableError("RPC disabled in config")
+
+    results: List[Tuple[Any, Optional[ParticlRPCError]]] = []
+    for start in range(0, len(calls), client.batch_size):
+        results.extend(client.batch(calls[start:start + client.batch_size], wallet=wallet))
+    return results
@@ -4,25 +4,39 @@ import subprocess
 import re
 
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List
 from rich.console import Console
 from datetime import datetime
 from particl_moderation.utils.config import get_config, get_full_path
 from particl_moderation.utils.platform_compat import is_windows
 from particl_moderation.particl.particl_core_manager import ParticlCoreManager
+from particl_moderation.particl.rpc import rpc_command, rpc_stream, RPCUnavailableError, ParticlRPCError
+from particl_moderation.particl.inbox import INBOX_READ_ERRORS, InboxWatermark, iter_json_array_items
 from particl_moderation.utils.error_handler import handle_keyboard_interrupt, initialize_error_handling
+from particl_moderation.utils.listing_index import get_listing_index
+from particl_moderation.utils.queue_store import get_queue_store
 
 console = Console()
 
 initialize_error_handling()
 
+LISTING_ACTION_TYPE = "MPA_LISTING_ADD_03"
+
+def get_listing_watermark() -> InboxWatermark:
+    return InboxWatermark(get_full_path("paths.listing_watermark_file"))
+
 def ensure_file_exists(file_path: str) -> None:
     if not os.path.exists(file_path):
         with open(file_path, 'w') as f:
             pass 
         os.chmod(file_path, 0o644)  
 
-def _run_particl_command(command: List[str], active_wallet: Optional[str] = None) -> Optional[str]:
+def _run_particl_command(command: List[str], active_wallet: Optional[str] = None, silent: bool = False) -> Optional[str]:
+    try:
+        return rpc_command(command, active_wallet, silent=silent) or None
+    except RPCUnavailableError:
+        pass
+
     core_manager = ParticlCoreManager()
     # if not core_manager.check_particl_core_exists():
     #     console.print("[bold red]Particl Core is not installed. Please install it from the settings menu.[/bold red]")
@@ -57,15 +71,74 @@ def _run_particl_command(command: List[str], active_wallet: Optional[str] = None
         return process.stdout.strip() if process.stdout else None
 
     except subprocess.CalledProcessError as e:
+        if not silent:
+            console.print(f"[bold red]Error running command: {e}[/bold red]")
+        return None
+    except PermissionError:
+        console.print(f"[bold red]Permission denied when trying to execute {cli_path}. Please check file permissions.[/bold red]")
+        return None
+
+def _iter_process_output(process: subprocess.Popen, chunk_size: int = 65536) -> Iterator[str]:
+    completed = False
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        completed = True
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+        if returncode != 0:
+            console.print(f"[bold red]Error running command: {stderr.strip()}[/bold red]")
+            if completed:
+                # The output read so far may be cut short, let the reader know
+                raise subprocess.CalledProcessError(returncode, process.args, stderr=stderr)
+
+def _stream_particl_command(command: List[str], active_wallet: Optional[str] = None) -> Optional[Iterator[str]]:
+    """Like _run_particl_command, but returns the output as an iterator of text chunks"""
+    try:
+        return rpc_stream(command, active_wallet)
+    except RPCUnavailableError:
+        pass
+    except ParticlRPCError as e:
         console.print(f"[bold red]Error running command: {e}[/bold red]")
         return None
+
+    cli_path = ParticlCoreManager().cli_path
+    wallet_param = f"-rpcwallet={active_wallet}" if active_wallet else ""
+    full_command = [cli_path] + ([wallet_param] if wallet_param else []) + command
+
+    startupinfo = None
+    if is_windows():
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+    try:
+        process = subprocess.Popen(
+            full_command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            startupinfo=startupinfo
+        )
     except PermissionError:
         console.print(f"[bold red]Permission denied when trying to execute {cli_path}. Please check file permissions.[/bold red]")
         return None
+    except OSError as e:
+        console.print(f"[bold red]Error running command: {e}[/bold red]")
+        return None
 
+    return _iter_process_output(process)
 
 @handle_keyboard_interrupt
-def particl_search() -> None:
+def particl_search(full_scan: bool = False) -> None:
+    """Queue the listings received since the last scan, or every listing in the inbox with `full_scan`"""
     try:
         active_wallet = get_config("particl.active_wallet")
 
@@ -84,24 +157,87 @@ def particl_search() -> None:
 
         console.print("[green]Successfully scanned SMSG buckets.[/green]")
 
-        # Get SMSG inbox
-        console.print("[cyan]Executing command: smsginbox all[/cyan]")
-        smsg_inbox = _run_particl_command(["smsginbox", "all"], active_wallet)
-        if not smsg_inbox:
+        # Only the first run (or a run after the cache was cleared or a failed
+        # read) reads the whole market history, afterwards only unread listings
+        # are fetched.
+        watermark = get_listing_watermark()
+        mode = watermark.start_read(full_scan)
+
+        # Get SMSG inbox, filtered on listing messages by the daemon
+        console.print(f"[cyan]Executing command: smsginbox {mode} {LISTING_ACTION_TYPE}[/cyan]")
+        smsg_inbox = _stream_particl_command(["smsginbox", mode, LISTING_ACTION_TYPE], active_wallet)
+        if smsg_inbox is None:
             console.print("[bold red]Failed to retrieve SMSG inbox. Please check your Particl Core installation and wallet status.[/bold red]")
             return
 
-        # Process listings
-        messages = json.loads(smsg_inbox).get('messages', [])
-        for smsg in messages:
-            process_smsg(smsg)
+        # Decode the reply one message at a time and process listings newer
+        # than the watermark, advancing it as we go
+        new_count = 0
+        try:
+            for smsg in watermark.new_messages(iter_json_array_items(smsg_inbox, "messages")):
+                process_smsg(smsg)
+                watermark.advance(smsg)
+                new_count += 1
+            watermark.rescan = False
+        except INBOX_READ_ERRORS as e:
+            watermark.rescan = True
+            console.print(f"[bold red]Reading the SMSG inbox failed: {e}. The next scan reads the whole inbox.[/bold red]")
+        finally:
+            watermark.save()
+        console.print(f"[cyan]{new_count} new inbox messages since last scan.[/cyan]")
 
         console.print("[green]Finished processing SMSG inbox.[/green]")
     except KeyboardInterrupt:
         console.print("\n[yellow]Operation interrupted by user. Returning to main menu...[/yellow]")
 
+def process_smsg_ids(msgids: List[str]) -> None:
+    """Fetch the messages announced over ZMQ by id and queue the listings among them"""
+    active_wallet = get_config("particl.active_wallet") or get_default_wallet()
+    if not active_wallet:
+        console.print("[bold red]Error: No active wallet found. Please set an active wallet in the settings menu.[/bold red]")
+        return
+
+    watermark = get_listing_watermark()
+    missed = False
+    # Fetched without marking them read: proposals and votes are announced
+    # here too, and the proposal index and vote tally read the unread ones
+    options = json.dumps({"encoding": "text", "setread": False})
+    for msgid in msgids:
+        result = _run_particl_command(["smsg", msgid, options], active_wallet)
+        if not result:
+            missed = True
+            continue
+        try:
+            smsg = json.loads(result)
+        except json.JSONDecodeError:
+            missed = True
+            continue
+        if LISTING_ACTION_TYPE not in smsg.get('text', ''):
+            continue
+        if watermark.is_new(smsg):
+            process_smsg(smsg)
+            watermark.advance(smsg)
+        # Only listings are ours to mark read, once they are queued
+        _run_particl_command(["smsg", msgid, json.dumps({"setread": True})], active_wallet)
+
+    if missed:
+        # Couldn't resolve some of the announced ids, pick them up from the unread inbox instead
+        console.print("[yellow]Some notified messages could not be fetched by id. Reading unread inbox...[/yellow]")
+        smsg_inbox = _stream_particl_command(["smsginbox", watermark.start_read(), LISTING_ACTION_TYPE], active_wallet)
+        if smsg_inbox is not None:
+            try:
+                for smsg in watermark.new_messages(iter_json_array_items(smsg_inbox, "messages")):
+                    process_smsg(smsg)
+                    watermark.advance(smsg)
+                watermark.rescan = False
+            except INBOX_READ_ERRORS as e:
+                watermark.rescan = True
+                console.print(f"[bold red]Reading the SMSG inbox failed: {e}. The next scan reads the whole inbox.[/bold red]")
+
+    watermark.save()
+
 def get_default_wallet() -> Optional[str]:
-    result = _run_particl_command(["listwallets"])
+    result = _run_particl_command(["listwallets"], silent=True)
     if result:
         wallets = json.loads(result)
         return wallets[0] if wallets else None
@@ -109,10 +245,15 @@ def get_default_wallet() -> Optional[str]:
 
 def process_smsg(smsg: Dict[str, Any]) -> None:
     try:
-        text = json.loads(smsg.get('text', '{}'))
+        raw_text = smsg.get('text', '{}')
+        # Cheap substring check so non-listing messages are never JSON-decoded
+        if LISTING_ACTION_TYPE not in raw_text:
+            return
+
+        text = json.loads(raw_text)
         action_type = text.get('action', {}).get('type')
         
-        if action_type != "MPA_LISTING_ADD_03":
+        if action_type != LISTING_ACTION_TYPE:
             return
 
         hash = text.get('action', {}).get('hash')
@@ -137,24 +278,13 @@ def process_smsg(smsg: Dict[str, Any]) -> None:
             console.print(f"[yellow]Error: Invalid hash format for listing. Skipping.[/yellow]")
             return
 
-        cache_file = get_full_path("paths.cache_file")
-        ensure_file_exists(cache_file)
-
-        with open(cache_file, 'r', encoding='utf-8', errors='replace') as cache:
-            if hash in cache.read().splitlines():
-                console.print(f"[yellow]Listing hash {hash} already exists in cache. Skipping.[/yellow]")
-                return
-
-        with open(cache_file, 'a', encoding='utf-8') as cache:
-            cache.write(f"{hash}\n")
-
-        queue_file = get_full_path("paths.queue_file")
-        ensure_file_exists(queue_file)
+        if not get_listing_index().add(hash):
+            console.print(f"[yellow]Listing hash {hash} already exists in cache. Skipping.[/yellow]")
+            return
 
         # Write the cleaned up entry to the queue
         date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        with open(queue_file, 'a', encoding='utf-8') as queue:
-            queue.write(f"[{date}] | {hash} | {title} | {description}\n")
+        get_queue_store().enqueue(date, hash, title, description)
 
         console.print("[green]Item added to queue successfully.[/green]")
         console.print(f"Hash: {hash}")
@@ -0,0 +1,82 @@
+import time
+
+from typing import List, Optional
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
+console = Console()
+
+SMSG_TOPIC = b"smsg"
+SMSG_MSGID_BYTES = 28
+
+def parse_smsg_notification(body: bytes) -> str:
+    """Extract the message id from a ZMQ smsg notification body.
+
+    particld may prefix the id with a small version/flags header, so the id
+    is taken from the trailing bytes of the payload.
+    """
+    return body[-SMSG_MSGID_BYTES:].hex()
+
+class SMSGListener:
+    def __init__(self, address: str):
+        self.address = address
+        self.context = zmq.Context.instance()
+        self.socket = self.context.socket(zmq.SUB)
+        self.socket.setsockopt(zmq.SUBSCRIBE, SMSG_TOPIC)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(address)
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket, zmq.POLLIN)
+
+    def _drain(self) -> List[str]:
+        msgids = []
+        while True:
+            try:
+                frames = self.socket.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return msgids
+            # Frames are [topic, body, sequence]
+            if len(frames) >= 2 and frames[0] == SMSG_TOPIC and frames[1]:
+                msgid = parse_smsg_notification(frames[1])
+                if msgid not in msgids:
+                    msgids.append(msgid)
+
+    def wait_for_messages(self, timeout: float) -> List[str]:
+        """Block up to `timeout` seconds and return the ids of newly announced messages"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            # Poll in short slices so Ctrl+C is handled promptly
+            if self.poller.poll(int(min(remaining, 1.0) * 1000)):
+                msgids = self._drain()
+                if msgids:
+                    return msgids
+
+    def close(self) -> None:
+        self.socket.close()
+
+def create_smsg_listener() -> Optional[SMSGListener]:
+    """Return a listener for particld's SMSG notifications, or None to keep polling"""
+    address = get_config("particl.zmq_smsg_address", "")
+    if not address:
+        return None
+
+    if zmq is None:
+        console.print("[yellow]particl.zmq_smsg_address is set but pyzmq is not installed. Falling back to polling.[/yellow]")
+        return None
+
+    try:
+        listener = SMSGListener(address)
+    except zmq.ZMQError as e:
+        console.print(f"[yellow]Could not subscribe to SMSG notifications at {address}: {e}. Falling back to polling.[/yellow]")
+        return None
+
+    console.print(f"[green]Subscribed to SMSG notifications at {address}[/green]")
+    return listener
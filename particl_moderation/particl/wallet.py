@@ -5,6 +5,7 @@ import qrcode
 from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Optional, Tuple, Any
 from particl_moderation.particl.particl_core_manager import ParticlCoreManager
+from particl_moderation.particl.rpc import rpc_command, RPCUnavailableError
 from particl_moderation.utils.config import get_config, set_config
 from rich.console import Console
 from rich.table import Table
@@ -23,13 +24,18 @@ class ParticlWallet:
             if self.active_wallet:
                 set_config("particl.active_wallet", self.active_wallet)
 
-    def _run_particl_command(self, command: List[str], wallet: str = None) -> Optional[str]:
+    def _run_particl_command(self, command: List[str], wallet: str = None, silent: bool = False) -> Optional[str]:
         """Execute a Particl command with comprehensive error handling"""
         # if not self.core_manager.check_particl_core_exists():
         #     console.print("[red]Particl Core is not installed. Please install it from the settings menu.[/red]")
         #     return None
 
         wallet_to_use = wallet if wallet else self.active_wallet
+        try:
+            return rpc_command(command, wallet_to_use, silent=silent)
+        except RPCUnavailableError:
+            pass
+
         full_command = [self.core_manager.cli_path]
         if wallet_to_use:
             full_command.append(f"-rpcwallet={wallet_to_use}")
@@ -39,9 +45,10 @@ class ParticlWallet:
             result = subprocess.run(full_command, check=True, capture_output=True, text=True)
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
-            console.print(f"[bold red]Error running Particl command: {e}[/bold red]")
-            if e.stderr:
-                console.print(f"[red]Error output: {e.stderr}[/red]")
+            if not silent:
+                console.print(f"[bold red]Error running Particl command: {e}[/bold red]")
+                if e.stderr:
+                    console.print(f"[red]Error output: {e.stderr}[/red]")
             return None
         except OSError as e:
             if hasattr(e, 'winerror') and e.winerror == 193:  # Windows error for "not a valid Win32 application"
@@ -68,7 +75,7 @@ class ParticlWallet:
         return self.core_manager.get_sync_status()
     
     def get_active_wallet(self) -> Optional[str]:
-        result = self._run_particl_command(["listwallets"])
+        result = self._run_particl_command(["listwallets"], silent=True)
         if result:
             wallets = json.loads(result)
             return wallets[0] if wallets else None
@@ -415,7 +422,7 @@ class ParticlWallet:
         console.print(utxo_table)
 
     def get_balance(self) -> float:
-        result = self._run_particl_command(["getbalance"])
+        result = self._run_particl_command(["getbalance"], silent=True)
         return float(result) if result else 0.0
 
     def get_new_address(self, label: str = "") -> Optional[str]:
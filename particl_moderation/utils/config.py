@@ -31,14 +31,57 @@ class Config:
             "particl": {
                 "cli_path": "",
                 "data_dir": "",
-                "active_wallet": "testtest"
+                "active_wallet": "testtest",
+                "rpc_enabled": True,
+                "rpc_host": "127.0.0.1",
+                "rpc_port": 51735,
+                "rpc_user": "",
+                "rpc_password": "",
+                "rpc_cookie_file": "",
+                "rpc_timeout": 120,
+                "rpc_pool_size": 8,
+                "rpc_batch_size": 25,
+                "zmq_smsg_address": "",
+                "zmq_full_scan_interval": 3600,
+                "inbox_fetch_mode": "unread",
+                "vote_workers": 4
             },
             "moderation": {
                 "enabled": True,
             },
             "llm": {
                 "model": "gemma2:2b",
-                "ollama_path": ""
+                "ollama_path": "",
+                "use_api": True,
+                "ollama_url": "http://127.0.0.1:11434",
+                "endpoints": [],
+                "eject_after_failures": 2,
+                "probe_interval": 30,
+                "keep_alive": "30m",
+                "request_timeout": 120,
+                "max_parallel": 4,
+                "parallel_listings": 2,
+                "prompt_layout": "chat",
+                "structured_output": True,
+                "classification_mode": "sampling",
+                "options": {},
+                "cascade": {
+                    "enabled": False,
+                    "first_model": "gemma2:2b",
+                    "threshold": 4,
+                    "max_samples": 5,
+                    "min_agreement": 0.8
+                },
+                "decision": {
+                    "rule": "threshold",
+                    "threshold": 6,
+                    "max_samples": 10,
+                    "min_samples": 3,
+                    "p0": 0.4,
+                    "p1": 0.8,
+                    "alpha": 0.05,
+                    "beta": 0.05
+                }
             },
             "logging": {
                 "level": "INFO",
@@ -46,9 +89,54 @@ class Config:
             },
             "paths": {
                 "cache_file": os.path.join(self.config_dir, "listing_cache.txt"),
+                "cache_index_file": os.path.join(self.config_dir, "listing_cache.idx"),
                 "queue_file": os.path.join(self.config_dir, "queue.txt"),
+                "queue_db_file": os.path.join(self.config_dir, "queue.db"),
                 "vote_queue_file": os.path.join(self.config_dir, "vote_queue.txt"),
                 "results_file": os.path.join(self.config_dir, "results.txt"),
+                "listing_watermark_file": os.path.join(self.config_dir, "listing_watermark.json"),
+                "proposal_index_file": os.path.join(self.config_dir, "proposal_index.json"),
+                "proposal_watermark_file": os.path.join(self.config_dir, "proposal_watermark.json"),
+                "vote_ledger_file": os.path.join(self.config_dir, "vote_ledger.db"),
+                "tally_file": os.path.join(self.config_dir, "vote_tally.json"),
+                "tally_watermark_file": os.path.join(self.config_dir, "vote_tally_watermark.json"),
+                "verdict_cache_file": os.path.join(self.config_dir, "verdict_cache.db"),
+                "knn_index_file": os.path.join(self.config_dir, "knn_index.f32"),
+                "rule_embeddings_file": os.path.join(self.config_dir, "rule_embeddings.npz"),
+            },
+            "listing_index": {
+                "bloom_capacity": 10000000,
+                "bloom_error_rate": 0.01,
+                "compact_threshold": 100000
+            },
+            "prefilter": {
+                "enabled": False,
+                "min_stem_length": 4,
+                "extra_terms": []
+            },
+            "knn": {
+                "enabled": False,
+                "embedding_model": "nomic-embed-text",
+                "top_k": 5,
+                "min_similarity": 0.95
+            },
+            "rule_selection": {
+                "enabled": False,
+                "top_k": 2,
+                "min_similarity": 0.35
+            },
+            "tally": {
+                "enabled": False,
+                "settled_action": "skip"
+            },
+            "vote_ledger": {
+                "max_entries": 100000,
+                "max_age_days": 90
+            },
+            "verdict_cache": {
+                "enabled": True,
+                "max_entries": 100000,
+                "ttl_days": 30
             },
             "rules": {
                 "config_file": "rules_config.json",
@@ -1,6 +1,8 @@
 import time
 
-from particl_moderation.particl.search import particl_search
+from particl_moderation.particl.search import particl_search, process_smsg_ids
+from particl_moderation.particl.smsg_listener import create_smsg_listener
+from particl_moderation.utils.config import get_config
 from particl_moderation.utils.queue_utils import process_queue
 from particl_moderation.moderation.voting import process_vote_queue
 from particl_moderation.utils.error_handler import handle_keyboard_interrupt
@@ -8,30 +10,52 @@ from rich.console import Console
 
 console = Console()
 
+CYCLE_DELAY = 60
+
 @handle_keyboard_interrupt
 def continuous_mode():
     console.print("[bold cyan]Starting Continuous Mode[/bold cyan]")
+    listener = create_smsg_listener()
+    full_scan_interval = float(get_config("particl.zmq_full_scan_interval", 3600))
+    last_full_scan = None
+    notified_msgids = []
     try:
         while True:
             console.print("\n[bold]--- Starting new cycle ---[/bold]")
-            
-            console.print("[yellow]Scanning for new listings...[/yellow]")
-            particl_search()
-            
+
+            # With ZMQ notifications the inbox is only scanned on start-up and
+            # then periodically, as a safety net for dropped notifications. The
+            # periodic scans read the whole inbox, since a message whose
+            # notification was lost may already be marked read.
+            if listener is None or last_full_scan is None or time.monotonic() - last_full_scan >= full_scan_interval:
+                console.print("[yellow]Scanning for new listings...[/yellow]")
+                particl_search(full_scan=listener is not None and last_full_scan is not None)
+                last_full_scan = time.monotonic()
+            elif notified_msgids:
+                console.print(f"[yellow]Fetching {len(notified_msgids)} notified messages...[/yellow]")
+                process_smsg_ids(notified_msgids)
+
             console.print("[yellow]Processing queue...[/yellow]")
             process_queue()
-            
+
             console.print("[yellow]Generating and moderating...[/yellow]")
 
             # multiple_llm_calls("", "")
-            
+
             console.print("[yellow]Processing vote queue...[/yellow]")
             process_vote_queue()
-            
-            console.print("[green]Cycle completed. Waiting before next cycle...[/green]")
-            time.sleep(60)
-    
+
+            if listener is None:
+                console.print("[green]Cycle completed. Waiting before next cycle...[/green]")
+                time.sleep(CYCLE_DELAY)
+            else:
+                console.print("[green]Cycle completed. Waiting for new SMSG notifications...[/green]")
+                notified_msgids = listener.wait_for_messages(CYCLE_DELAY)
+
     except KeyboardInterrupt:
         console.print("\n[bold red]Continuous mode interrupted. Exiting...[/bold red]")
-    
+    finally:
+        if listener is not None:
+            listener.close()
+
     console.print("[bold cyan]Continuous mode ended.[/bold cyan]")
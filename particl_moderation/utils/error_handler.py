@@ -2,7 +2,9 @@ import sys
 import signal
 import threading
 
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from functools import wraps
+from typing import Iterable, Iterator
 from rich.console import Console
 
 console = Console()
@@ -17,6 +19,23 @@ def check_for_interrupt():
     if interrupt_received.is_set():
         raise KeyboardInterrupt("Operation interrupted by user")
 
+def as_completed_interruptible(futures: Iterable[Future], poll_interval: float = 0.2) -> Iterator[Future]:
+    """Yield futures as they finish, checking for an interrupt while waiting.
+
+    Futures that haven't started yet are cancelled if an interrupt arrives or
+    the caller stops iterating early.
+    """
+    pending = set(futures)
+    try:
+        while pending:
+            check_for_interrupt()
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future
+    finally:
+        for future in pending:
+            future.cancel()
+
 def handle_keyboard_interrupt(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
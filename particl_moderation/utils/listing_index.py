@@ -0,0 +1,253 @@
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import struct
+import threading
+
+from typing import Iterator, Optional, Set
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.singleton import shared_instance
+
+console = Console()
+
+DIGEST_SIZE = 32
+INDEX_MAGIC = b"PMLIDX01"
+# magic, covered log bytes, record count, bloom size in bytes, bloom hash count
+INDEX_HEADER = struct.Struct("<8sQQQI")
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: Optional[bytearray] = None, hash_count: int = 0):
+        capacity = max(capacity, 1)
+        if bits is None:
+            num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+            bits = bytearray((num_bits + 7) // 8)
+            hash_count = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.bits = bits
+        self.num_bits = len(bits) * 8
+        self.hash_count = hash_count
+
+    def _positions(self, digest: bytes) -> Iterator[int]:
+        # Double hashing over a 128-bit digest, so non-uniform keys are safe too
+        mixed = hashlib.blake2b(digest, digest_size=16).digest()
+        h1 = int.from_bytes(mixed[:8], 'little')
+        h2 = int.from_bytes(mixed[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, digest: bytes) -> None:
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+class ListingIndex:
+    """Set of already seen listing hashes backed by listing_cache.txt.
+
+    The text cache stays the append-only log of seen hashes. Periodically the
+    log is compacted into a sorted array of 32-byte digests which is
+    memory-mapped and binary searched; hashes appended since then are kept in
+    a small in-memory delta set. A Bloom filter in front answers most lookups
+    for unseen listings without touching either.
+    """
+    def __init__(self, log_path: str, index_path: str, bloom_capacity: int = 10_000_000,
+                 bloom_error_rate: float = 0.01, compact_threshold: int = 100_000):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._records_offset = INDEX_HEADER.size
+        self._count = 0
+        self._delta: Set[bytes] = set()
+        self._log_size = 0
+        self._bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        self._load()
+
+    @staticmethod
+    def _to_digest(listing_hash: str) -> Optional[bytes]:
+        try:
+            digest = bytes.fromhex(listing_hash)
+        except ValueError:
+            return None
+        return digest if len(digest) == DIGEST_SIZE else None
+
+    def _close_index(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+    def _reset(self) -> None:
+        self._close_index()
+        self._delta = set()
+        self._log_size = 0
+        self._bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+
+    def _open_index(self) -> int:
+        """Map the compacted index and return the number of log bytes it covers"""
+        if not os.path.exists(self.index_path):
+            return 0
+        try:
+            f = open(self.index_path, 'rb')
+            header = f.read(INDEX_HEADER.size)
+            magic, covered, count, bloom_size, hash_count = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC:
+                raise ValueError("bad magic")
+            f.seek(INDEX_HEADER.size + count * DIGEST_SIZE)
+            bloom_bits = bytearray(f.read(bloom_size))
+            if len(bloom_bits) != bloom_size:
+                raise ValueError("truncated bloom filter")
+        except (OSError, ValueError, struct.error) as e:
+            console.print(f"[yellow]Listing index {self.index_path} is unreadable ({e}). Rebuilding it.[/yellow]")
+            return 0
+
+        self._file = f
+        self._count = count
+        if count:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._bloom = BloomFilter(0, bits=bloom_bits, hash_count=hash_count)
+        return covered
+
+    def _load(self) -> None:
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        covered = self._open_index()
+        if covered > log_size:
+            # The cache was cleared since the index was written
+            self._close_index()
+            self._bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+            covered = 0
+        self._log_size = covered
+        self._read_log_tail()
+        if len(self._delta) >= self.compact_threshold:
+            self.compact()
+
+    def _read_log_tail(self) -> None:
+        """Pull hashes appended to the log since the last read into the delta set"""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._log_size)
+            data = f.read()
+        # Ignore a partially written last line, it'll be picked up next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            digest = self._to_digest(line.strip().decode('ascii', errors='replace'))
+            if digest is not None and not self._in_index(digest):
+                self._delta.add(digest)
+                self._bloom.add(digest)
+        self._log_size += end
+
+    def _sync_with_log(self) -> None:
+        size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if size < self._log_size:
+            # listing_cache.txt was truncated (cache cleared), start over
+            self._reset()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        if size > self._log_size:
+            self._read_log_tail()
+
+    def _in_index(self, digest: bytes) -> bool:
+        if not self._count:
+            return False
+        lo, hi = 0, self._count
+        base = self._records_offset
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * DIGEST_SIZE
+            record = self._mmap[offset:offset + DIGEST_SIZE]
+            if record == digest:
+                return True
+            if record < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return False
+
+    def contains(self, listing_hash: str) -> bool:
+        digest = self._to_digest(listing_hash)
+        if digest is None:
+            return False
+        with self._lock:
+            self._sync_with_log()
+            if digest not in self._bloom:
+                return False
+            return digest in self._delta or self._in_index(digest)
+
+    def add(self, listing_hash: str) -> bool:
+        """Record a hash as seen. Returns False if it was already present."""
+        digest = self._to_digest(listing_hash)
+        if digest is None:
+            return False
+        with self._lock:
+            if self.contains(listing_hash):
+                return False
+            line = f"{listing_hash}\n".encode('utf-8')
+            with open(self.log_path, 'ab') as f:
+                f.write(line)
+            self._log_size += len(line)
+            self._delta.add(digest)
+            self._bloom.add(digest)
+            if len(self._delta) >= self.compact_threshold:
+                self.compact()
+            return True
+
+    def _iter_index(self) -> Iterator[bytes]:
+        base = self._records_offset
+        for i in range(self._count):
+            offset = base + i * DIGEST_SIZE
+            yield self._mmap[offset:offset + DIGEST_SIZE]
+
+    def compact(self) -> None:
+        """Merge the delta set into the sorted on-disk index"""
+        with self._lock:
+            count = self._count + len(self._delta)
+            bloom = BloomFilter(max(self.bloom_capacity, count * 2), self.bloom_error_rate)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, 0, 0, 0, 0))
+                for digest in heapq.merge(self._iter_index(), sorted(self._delta)):
+                    f.write(digest)
+                    bloom.add(digest)
+                f.write(bloom.bits)
+                f.seek(0)
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, self._log_size, count, len(bloom.bits), bloom.hash_count))
+
+            covered = self._log_size
+            self._close_index()
+            os.replace(tmp_path, self.index_path)
+            self._open_index()
+            self._log_size = covered
+            self._delta = set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            open(self.log_path, 'wb').close()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+    def __len__(self) -> int:
+        return self._count + len(self._delta)
+
+@shared_instance
+def get_listing_index() -> ListingIndex:
+    """Return the process-wide listing index, loading it on first use"""
+    log_path = get_config("paths.cache_file", "listing_cache.txt")
+    return ListingIndex(
+        log_path,
+        get_config("paths.cache_index_file", f"{log_path}.idx"),
+        bloom_capacity=int(get_config("listing_index.bloom_capacity", 10_000_000)),
+        bloom_error_rate=float(get_config("listing_index.bloom_error_rate", 0.01)),
+        compact_threshold=int(get_config("listing_index.compact_threshold", 100_000)),
+    )
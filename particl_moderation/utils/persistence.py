@@ -0,0 +1,30 @@
+import json
+import os
+import sqlite3
+
+from typing import Any
+
+def read_json(path: str) -> Any:
+    """Load a JSON file. Raises OSError / ValueError like reading it directly would"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_json(path: str, data: Any, **dump_options: Any) -> None:
+    """Write a JSON file through a temporary file and os.replace, so a crash can't
+    leave a half-written file behind. Raises OSError"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_options)
+    os.replace(tmp_path, path)
+
+def open_sqlite(db_path: str, schema: str) -> sqlite3.Connection:
+    """Open a WAL-mode SQLite database shared by every thread and create its tables.
+
+    The connection is in autocommit mode; callers group writes with explicit
+    BEGIN / COMMIT. `schema` holds the CREATE ... IF NOT EXISTS statements.
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
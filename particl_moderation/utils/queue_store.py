@@ -0,0 +1,118 @@
+import os
+import threading
+
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+from rich.console import Console
+from particl_moderation.utils.config import get_config
+from particl_moderation.utils.persistence import open_sqlite
+from particl_moderation.utils.singleton import shared_instance
+
+console = Console()
+
+# (id, date, hash, title, description)
+QueueItem = Tuple[int, str, str, str, str]
+
+class QueueStore:
+    """Durable FIFO of listings waiting for classification.
+
+    Items live in a WAL-mode SQLite table keyed by an autoincrement id, so the
+    head is the smallest id and the tail the largest. Enqueue is an append,
+    peek/remove touch a single row through the primary key, and a crash can't
+    lose more than the transaction in flight.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._batch_depth = 0
+        self.conn = open_sqlite(db_path,
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "date TEXT NOT NULL, "
+            "hash TEXT NOT NULL, "
+            "title TEXT NOT NULL, "
+            "description TEXT NOT NULL);"
+        )
+
+    @contextmanager
+    def batch(self) -> Iterator["QueueStore"]:
+        """Group several operations into one transaction and commit once"""
+        with self._lock:
+            if self._batch_depth == 0:
+                self.conn.execute("BEGIN")
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.execute("COMMIT")
+
+    def enqueue(self, date: str, hash: str, title: str, description: str) -> int:
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO queue (date, hash, title, description) VALUES (?, ?, ?, ?)",
+                (date, hash, title, description)
+            )
+            return cursor.lastrowid
+
+    def peek(self) -> Optional[QueueItem]:
+        items = self.peek_many(1)
+        return items[0] if items else None
+
+    def peek_many(self, limit: int) -> List[QueueItem]:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, date, hash, title, description FROM queue ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove(self, item_id: int) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM queue WHERE id = ?", (item_id,))
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM queue LIMIT 1").fetchone() is None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def items(self) -> List[QueueItem]:
+        with self._lock:
+            return self.conn.execute("SELECT id, date, hash, title, description FROM queue ORDER BY id").fetchall()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM queue")
+
+def migrate_text_queue(store: QueueStore, queue_file: str) -> int:
+    """Import a legacy pipe-delimited queue.txt into the store, once"""
+    if not queue_file or not os.path.exists(queue_file) or os.path.getsize(queue_file) == 0:
+        return 0
+
+    imported = 0
+    with open(queue_file, 'rb') as f, store.batch():
+        for raw_line in f:
+            line = raw_line.decode('utf-8', errors='replace').strip()
+            parts = line.split('|', 3)
+            if len(parts) < 4:
+                continue
+            date = parts[0].strip()[1:-1]
+            store.enqueue(date, parts[1].strip(), parts[2].strip(), parts[3].strip())
+            imported += 1
+
+    os.replace(queue_file, f"{queue_file}.migrated")
+    console.print(f"[green]Migrated {imported} queued listings from {queue_file} to {store.db_path}.[/green]")
+    return imported
+
+@shared_instance
+def get_queue_store() -> QueueStore:
+    """Return the process-wide queue store, migrating queue.txt on first use"""
+    store = QueueStore(get_config("paths.queue_db_file", "queue.db"))
+    migrate_text_queue(store, get_config("paths.queue_file", "queue.txt"))
+    return store
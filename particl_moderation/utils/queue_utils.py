@@ -1,33 +1,35 @@
-import os
 import hashlib
+import sqlite3
+import threading
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Dict
 from rich.console import Console
 from particl_moderation.utils.config import get_config
 from particl_moderation.utils.error_handler import handle_keyboard_interrupt, initialize_error_handling, check_for_interrupt
-from particl_moderation.utils.log import add_log_entry
-from particl_moderation.llm.generate import multiple_llm_calls
+from particl_moderation.utils.log import add_log_entry, get_log_file
+from particl_moderation.utils.listing_index import get_listing_index
+from particl_moderation.utils.queue_store import QueueItem, get_queue_store
+from particl_moderation.llm.cascade import get_model_cascade
+from particl_moderation.llm.generate import check_unmatched_listing, classify_listing, get_model_key, get_rules_digest
+from particl_moderation.llm.decision import FAILED_REQUESTS_NOTE
+from particl_moderation.llm.embedding_index import get_embedding_index, record_result
+from particl_moderation.llm.ollama_client import get_ollama_client
+from particl_moderation.llm.prefilter import get_prefilter
+from particl_moderation.llm.rule_selection import get_rule_selector
+from particl_moderation.llm.verdict_cache import get_verdict_cache, verdict_cache_key
 
 initialize_error_handling()
 console = Console()
 
-def get_queue_file() -> str:
-    return get_config("paths.queue_file", "queue.txt")
+# Serialises writes to results.txt / vote_queue.txt when listings are classified concurrently
+_results_lock = threading.Lock()
 
 def get_cache_file() -> str:
     return get_config("paths.cache_file", "listing_cache.txt")
 
-def ensure_file_exists(file_path: str) -> None:
-    if not os.path.exists(file_path):
-        with open(file_path, 'wb') as f:
-            pass
-
 def add_to_queue(hash: str, title: str, description: str, type: str) -> bool:
-    queue_file = get_queue_file()
-    cache_file = get_cache_file()
-    ensure_file_exists(queue_file)
-    ensure_file_exists(cache_file)
-
     if type == "dummy":
         hash = hashlib.sha256(f"{hash}|{title}|{description}".encode()).hexdigest()
     elif len(hash) != 64 or not all(c in '0123456789abcdefABCDEF' for c in hash):
@@ -36,27 +38,18 @@ def add_to_queue(hash: str, title: str, description: str, type: str) -> bool:
 
     if type != "dummy":
         try:
-            with open(cache_file, 'rb') as f:
-                if hash.encode('utf-8') in f.read():
-                    console.print(f"[yellow]Listing hash {hash} already exists in cache. Skipping.[/yellow]")
-                    return False
-        except Exception as e:
-            console.print(f"[red]Error reading cache file: {str(e)}[/red]")
-            return False
-
-        try:
-            with open(cache_file, 'ab') as f:
-                f.write(f"{hash}\n".encode('utf-8'))
+            if not get_listing_index().add(hash):
+                console.print(f"[yellow]Listing hash {hash} already exists in cache. Skipping.[/yellow]")
+                return False
         except Exception as e:
-            console.print(f"[red]Error writing to cache file: {str(e)}[/red]")
+            console.print(f"[red]Error updating cache file: {str(e)}[/red]")
             return False
 
     date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     try:
-        with open(queue_file, 'ab') as f:
-            f.write(f"[{date}] | {hash} | {title} | {description}\n".encode('utf-8'))
-    except Exception as e:
-        console.print(f"[red]Error writing to queue file: {str(e)}[/red]")
+        get_queue_store().enqueue(date, hash, title, description)
+    except sqlite3.Error as e:
+        console.print(f"[red]Error writing to queue: {str(e)}[/red]")
         return False
 
     console.print("[green]Item added to queue successfully.[/green]")
@@ -67,117 +60,175 @@ def add_to_queue(hash: str, title: str, description: str, type: str) -> bool:
     return True
 
 def display_queue() -> None:
-    queue_file = get_queue_file()
-    ensure_file_exists(queue_file)
     try:
-        with open(queue_file, 'rb') as f:
-            content = f.read().decode('utf-8', errors='replace')
-        if content:
+        items = get_queue_store().items()
+        if items:
             console.print("[bold]Current Queue:[/bold]")
-            console.print(content)
+            for _, date, hash, title, description in items:
+                console.print(f"[{date}] | {hash} | {title} | {description}", markup=False)
         else:
             console.print("[yellow]The queue is empty.[/yellow]")
-    except Exception as e:
-        console.print(f"[red]Error reading queue file: {str(e)}[/red]")
+    except sqlite3.Error as e:
+        console.print(f"[red]Error reading queue: {str(e)}[/red]")
 
-@handle_keyboard_interrupt
-def execute_queue_item() -> bool:
-    queue_file = get_queue_file()
-    
-    try:
-        with open(queue_file, 'rb') as f:
-            first_line = f.readline().decode('utf-8', errors='replace').strip()
-    except Exception as e:
-        console.print(f"[red]Error reading queue file: {str(e)}[/red]")
-        return False
-
-    if not first_line:
-        console.print("[yellow]The queue is empty.[/yellow]")
-        return False
-
-    parts = first_line.split('|')
-    if len(parts) < 4:
-        console.print("[bold red]Invalid queue item format.[/bold red]")
-        return False
-
-    date = parts[0].strip()[1:-1]
-    hash = parts[1].strip()
-    title = parts[2].strip()
-    description = parts[3].strip()
+def classify_queue_item(item: QueueItem) -> bool:
+    store = get_queue_store()
+    item_id, date, hash, title, description = item
 
     console.print("\n[bold]Executing queue item:[/bold]")
     console.print(f"Title: {title}")
 
     if not title:
-        add_log_entry(hash, title, description, datetime.now().strftime("%d-%m-%Y"), "ignore", "Empty title", "0|0|10")
-        _remove_first_queue_item()
+        with _results_lock:
+            add_log_entry(hash, title, description, datetime.now().strftime("%d-%m-%Y"), "ignore", "Empty title", "0|0|10")
+            store.remove(item_id)
         console.print("[yellow]Item removed from queue.[/yellow]")
         console.print("[yellow]Empty title. Exiting.[/yellow]")
         return False
 
-    try:
-        true_count, false_count, ignore_count = multiple_llm_calls(title, description)
-    except KeyboardInterrupt:
-        console.print("\n[yellow]LLM calls interrupted by user.[/yellow]")
-        return False
+    cache = get_verdict_cache()
+    cache_key = verdict_cache_key(title, description, get_rules_digest(), get_model_key()) if cache is not None else None
+    verdict = cache.get(cache_key) if cache is not None else None
+
+    neighbours = get_embedding_index() if not verdict else None
+    neighbour_verdict = neighbours.lookup(title, description) if neighbours is not None else None
 
-    if true_count >= 6:
-        final_result = "upvote"
-    elif false_count >= 6:
-        final_result = "downvote"
+    if verdict:
+        llm_response = f"Cached verdict ({verdict.samples} samples, {verdict.rule})"
+    elif neighbour_verdict:
+        verdict = neighbour_verdict
+        llm_response = f"Nearest neighbours ({neighbours.top_k} similar past listings)"
     else:
-        final_result = "ignore"
+        # Only screen listings that are about to reach the LLM, so the prefilter stats count real samples
+        prefilter = get_prefilter()
+        screening = prefilter.screen(title, description) if prefilter else "match"
+        verdict = check_unmatched_listing(title, description) if screening == "check" else None
+        if screening == "check":
+            prefilter.record_check(escalated=verdict is None)
+        if verdict:
+            llm_response = "Prefilter (no rule term matched, 1 sample agreed)"
+        else:
+            verdict = classify_listing(title, description)
+            if prefilter:
+                prefilter.record_classification(verdict.samples)
+            if verdict.rule == "logprobs":
+                llm_response = "Single LLM call (label probabilities, logprobs)"
+            else:
+                llm_response = f"Multiple LLM calls ({verdict.samples} samples, {verdict.rule})"
+            if verdict.stage:
+                # e.g. "Multiple LLM calls (5 samples, threshold) decided at stage 1 gemma2:2b"
+                llm_response += f" decided at {verdict.stage}"
+            if verdict.failed:
+                llm_response += f", {verdict.failed} {FAILED_REQUESTS_NOTE}"
+        # A verdict made up partly of failed requests isn't worth reusing
+        if cache is not None and not verdict.failed:
+            cache.put(cache_key, verdict)
+
+    console.print(f"[bold]Result:[/bold] {verdict.label} ({title})")
+    console.print(f"[bold]Score:[/bold] (True: {verdict.true_count}, False: {verdict.false_count}, Ignore: {verdict.ignore_count}, Samples: {verdict.samples})")
+
+    with _results_lock:
+        add_log_entry(hash, title, description, datetime.now().strftime("%d-%m-%Y"), verdict.label,
+                      llm_response, verdict.counts)
+        store.remove(item_id)
+    # Embedding the listing is an HTTP request, so the index is updated outside the results lock
+    record_result(hash, verdict.label, title, description, llm_response)
+    return True
 
-    console.print(f"[bold]Result:[/bold] {final_result}")
-    console.print(f"[bold]Score:[/bold] (True: {true_count}, False: {false_count}, Ignore: {ignore_count})")
+@handle_keyboard_interrupt
+def execute_queue_item() -> bool:
+    try:
+        item = get_queue_store().peek()
+    except sqlite3.Error as e:
+        console.print(f"[red]Error reading queue: {str(e)}[/red]")
+        return False
 
-    add_log_entry(hash, title, description, datetime.now().strftime("%d-%m-%Y"), final_result, "Multiple LLM calls", f"{true_count}|{false_count}|{ignore_count}")
+    if not item:
+        console.print("[yellow]The queue is empty.[/yellow]")
+        return False
 
-    _remove_first_queue_item()
-    return True
+    try:
+        return classify_queue_item(item)
+    except KeyboardInterrupt:
+        console.print("\n[yellow]LLM calls interrupted by user.[/yellow]")
+        return False
+
+def _process_queue_concurrently(workers: int) -> None:
+    """Classify up to `workers` queued listings at a time, refilling as each one finishes.
 
-def _remove_first_queue_item() -> None:
-    queue_file = get_queue_file()
+    The samples of every listing share the pool from get_sample_executor(), so
+    the total number of requests sent to Ollama stays at `llm.max_parallel`.
+    """
+    store = get_queue_store()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="queue-item")
+    in_flight: Dict[Future, int] = {}
     try:
-        with open(queue_file, 'rb') as f:
-            lines = f.readlines()
-        
-        with open(queue_file, 'wb') as f:
-            if len(lines) > 1:
-                f.writelines(lines[1:])
-            else:
-                # If it was the last line, just clear the file
-                pass
+        while True:
+            check_for_interrupt()
+            if len(in_flight) < workers:
+                running_ids = set(in_flight.values())
+                for item in store.peek_many(workers + len(in_flight)):
+                    if len(in_flight) >= workers:
+                        break
+                    if item[0] not in running_ids:
+                        in_flight[executor.submit(classify_queue_item, item)] = item[0]
+            if not in_flight:
+                break
 
-    except Exception as e:
-        console.print(f"[red]Error updating queue file: {str(e)}[/red]")
+            done, _ = wait(in_flight, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+                future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
 @handle_keyboard_interrupt
 def process_queue():
-    queue_file = get_queue_file()
-    if not os.path.exists(queue_file) or os.path.getsize(queue_file) == 0:
+    if get_queue_store().is_empty():
         console.print("[yellow]Queue is empty. No items to process.[/yellow]")
         return
 
     console.print("[bold]Processing queue...[/bold]")
+    neighbours = get_embedding_index()
+    if neighbours is not None:
+        neighbours.sync_with_results(get_log_file())
+    workers = max(1, int(get_config("llm.parallel_listings", 2)))
     try:
-        while True:
-            check_for_interrupt()
-            if not execute_queue_item():
-                break
+        if workers > 1:
+            _process_queue_concurrently(workers)
+        else:
+            while True:
+                check_for_interrupt()
+                if not execute_queue_item():
+                    break
     except KeyboardInterrupt:
         console.print("\n[yellow]Queue processing interrupted by user.[/yellow]")
     finally:
+        cache = get_verdict_cache()
+        if cache is not None and cache.hits + cache.misses:
+            stats = cache.stats()
+            console.print(f"Verdict cache: {stats['hits']} hits, {stats['misses']} misses "
+                          f"({stats['hit_rate']:.0%} hit rate, {stats['entries']} entries)")
+        prefilter = get_prefilter()
+        neighbours = get_embedding_index()
+        selector = get_rule_selector()
+        cascade = get_model_cascade()
+        client = get_ollama_client()
+        for summary in (prefilter.stats_summary() if prefilter else None,
+                        neighbours.stats_summary() if neighbours is not None else None,
+                        selector.stats_summary() if selector else None,
+                        cascade.stats_summary() if cascade else None,
+                        client.stats_summary() if client else None):
+            if summary:
+                console.print(summary)
         console.print("[green]Queue processing completed or interrupted.[/green]")
 
 def clear_queue():
-    queue_file = get_queue_file()
     try:
-        with open(queue_file, 'wb') as f:
-            pass
-        console.print("[green]Queue file cleared.[/green]")
-    except Exception as e:
-        console.print(f"[red]Error clearing queue file: {str(e)}[/red]")
+        get_queue_store().clear()
+        console.print("[green]Queue cleared.[/green]")
+    except sqlite3.Error as e:
+        console.print(f"[red]Error clearing queue: {str(e)}[/red]")
 
 if __name__ == "__main__":
     add_to_queue("1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef", "Test Title", "Test Description", "normal")
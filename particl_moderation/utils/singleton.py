@@ -0,0 +1,33 @@
+import threading
+
+from functools import wraps
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+def shared_instance(factory: Callable[[], Optional[T]]) -> Callable[[], Optional[T]]:
+    """Turn a factory into a getter for one process-wide instance.
+
+    The factory runs under a lock on the first call and its result is
+    returned from then on. A factory returning None (e.g. a database that
+    can't be opened) is tried again on the next call. `getter.reset()` drops
+    the instance.
+    """
+    lock = threading.Lock()
+    instance: Optional[T] = None
+
+    @wraps(factory)
+    def getter() -> Optional[T]:
+        nonlocal instance
+        with lock:
+            if instance is None:
+                instance = factory()
+            return instance
+
+    def reset() -> None:
+        nonlocal instance
+        with lock:
+            instance = None
+
+    getter.reset = reset
+    return getter
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from particl_moderation.particl import inbox, search
+
+class FakeInbox:
+    """Just enough of particld's SMSG inbox to tell read from unread messages"""
+    def __init__(self):
+        self.messages = []
+
+    def receive(self, msgid, received, action):
+        self.messages.append({"msgid": msgid, "received": received, "text": json.dumps({"action": action}), "read": False})
+
+    def is_read(self, msgid):
+        return next(smsg["read"] for smsg in self.messages if smsg["msgid"] == msgid)
+
+    def smsg(self, msgid, options):
+        for smsg in self.messages:
+            if smsg["msgid"] == msgid:
+                if options.get("setread"):
+                    smsg["read"] = True
+                return json.dumps({key: smsg[key] for key in ("msgid", "received", "text")})
+        return None
+
+    def smsginbox(self, mode, action_type):
+        found = [smsg for smsg in self.messages
+                 if action_type in smsg["text"] and (mode == "all" or not smsg["read"])]
+        if mode == "unread":
+            for smsg in found:
+                smsg["read"] = True
+        return json.dumps({"messages": [{key: smsg[key] for key in ("msgid", "received", "text")} for smsg in found]})
+
+    def run_command(self, command, active_wallet=None, silent=False):
+        if command[0] == "smsg":
+            return self.smsg(command[1], json.loads(command[2]))
+        if command[0] == "smsginbox":
+            return self.smsginbox(command[1], command[2])
+        return None
+
+@pytest.fixture
+def fake_inbox(monkeypatch, tmp_path):
+    fake = FakeInbox()
+    settings = {"particl.active_wallet": "moderation", "particl.inbox_fetch_mode": "unread"}
+    config = lambda key, default=None: settings.get(key, default)
+    monkeypatch.setattr(inbox, "get_config", config)
+    monkeypatch.setattr(search, "get_config", config)
+    monkeypatch.setattr(search, "_run_particl_command", fake.run_command)
+    monkeypatch.setattr(search, "get_listing_watermark", lambda: inbox.InboxWatermark(str(tmp_path / "listing_watermark.json")))
+    return fake
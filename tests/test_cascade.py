@@ -0,0 +1,33 @@
+from particl_moderation.llm.cascade import ModelCascade
+from particl_moderation.llm.decision import ThresholdRule, Verdict, verdict_from_probabilities
+
+def make_cascade() -> ModelCascade:
+    return ModelCascade("small", ThresholdRule(threshold=4, max_samples=5), min_agreement=0.8)
+
+def test_low_confidence_logprobs_verdict_escalates():
+    cascade = make_cascade()
+    first = verdict_from_probabilities({"true": 0.35, "false": 0.30, "ignore": 0.35}, cascade.first_rule)
+    assert first.samples == 1
+    assert not cascade.is_conclusive(first)
+
+    calls = []
+    def classify_with(model, rule):
+        calls.append(model)
+        return first if model == "small" else Verdict("downvote", 0, 6, 0, 6, "threshold")
+
+    verdict = cascade.classify("large", classify_with)
+    assert calls == ["small", "large"]
+    assert verdict.label == "downvote"
+    assert verdict.stage == "stage 2 large"
+
+def test_confident_logprobs_verdict_stops_at_first_stage():
+    cascade = make_cascade()
+    first = verdict_from_probabilities({"true": 0.02, "false": 0.95, "ignore": 0.03}, cascade.first_rule)
+    assert cascade.is_conclusive(first)
+    verdict = cascade.classify("large", lambda model, rule: first)
+    assert verdict.stage == "stage 1 small"
+
+def test_sampled_verdicts_need_min_agreement():
+    cascade = make_cascade()
+    assert cascade.is_conclusive(Verdict("upvote", 4, 1, 0, 5, "threshold"))
+    assert not cascade.is_conclusive(Verdict("ignore", 1, 1, 2, 4, "threshold"))
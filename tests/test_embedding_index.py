@@ -0,0 +1,27 @@
+import numpy as np
+
+from particl_moderation.llm import embedding_index
+from particl_moderation.llm.embedding_index import EmbeddingIndex
+
+VECTORS = {
+    "a": np.array([1.0, 0.0, 0.0], dtype=np.float32),
+    "b": np.array([0.0, 1.0, 0.0], dtype=np.float32),
+    "c": np.array([0.0, 0.0, 1.0], dtype=np.float32),
+}
+
+def test_vector_left_over_by_a_crash_is_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_index, "embed_listing", lambda title, description: VECTORS[title])
+    vectors_path = str(tmp_path / "knn_index.f32")
+    index = EmbeddingIndex(vectors_path, "model", top_k=1, min_similarity=0.9)
+    index.record("ha", "upvote", "a", "")
+    # Crash after the vector of "b" was written but before its meta row
+    with open(vectors_path, 'ab') as f:
+        f.write(VECTORS["b"].tobytes())
+
+    index = EmbeddingIndex(vectors_path, "model", top_k=1, min_similarity=0.9)
+    index.record("hc", "downvote", "c", "")
+
+    assert index.lookup("a", "").label == "upvote"
+    assert index.lookup("b", "") is None
+    assert index.lookup("c", "").label == "downvote"
+    assert len(EmbeddingIndex(vectors_path, "model")) == 2
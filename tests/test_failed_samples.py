@@ -0,0 +1,47 @@
+from particl_moderation.llm import generate
+from particl_moderation.llm.decision import ThresholdRule, Verdict
+from particl_moderation.llm.embedding_index import is_model_response
+from particl_moderation.llm.verdict_cache import VerdictCache
+from particl_moderation.utils import queue_utils
+
+class FakeStore:
+    def remove(self, item_id):
+        pass
+
+def test_failed_requests_are_counted(monkeypatch):
+    replies = iter(["true", generate.SAMPLE_FAILED, generate.SAMPLE_FAILED])
+    monkeypatch.setattr(generate, "generate_prompt_and_send", lambda *args: next(replies))
+    monkeypatch.setattr(generate, "get_max_parallel", lambda: 1)
+
+    verdict = generate.multiple_llm_calls("title", "description", rule=ThresholdRule(threshold=2, max_samples=3))
+
+    assert (verdict.label, verdict.ignore_count, verdict.failed) == ("ignore", 2, 2)
+
+def classify_with(tmp_path, monkeypatch, verdict):
+    cache = VerdictCache(str(tmp_path / "verdict_cache.db"))
+    recorded = []
+    monkeypatch.setattr(queue_utils, "get_verdict_cache", lambda: cache)
+    monkeypatch.setattr(queue_utils, "get_rules_digest", lambda: "rules")
+    monkeypatch.setattr(queue_utils, "get_model_key", lambda: "model")
+    monkeypatch.setattr(queue_utils, "get_prefilter", lambda: None)
+    monkeypatch.setattr(queue_utils, "get_embedding_index", lambda: None)
+    monkeypatch.setattr(queue_utils, "get_queue_store", FakeStore)
+    monkeypatch.setattr(queue_utils, "add_log_entry", lambda *args: None)
+    monkeypatch.setattr(queue_utils, "record_result", lambda *args: recorded.append(args[4]))
+    monkeypatch.setattr(queue_utils, "classify_listing", lambda title, description: verdict)
+
+    queue_utils.classify_queue_item((1, "date", "a" * 64, "title", "description"))
+    return cache, recorded[0]
+
+def test_verdict_is_cached_and_indexed(tmp_path, monkeypatch):
+    cache, llm_response = classify_with(tmp_path, monkeypatch, Verdict("downvote", 0, 6, 0, 6, "threshold"))
+
+    assert len(cache) == 1
+    assert is_model_response(llm_response)
+
+def test_verdict_with_failed_requests_is_not_cached_or_indexed(tmp_path, monkeypatch):
+    cache, llm_response = classify_with(tmp_path, monkeypatch, Verdict("ignore", 0, 0, 6, 6, "threshold", failed=6))
+
+    assert len(cache) == 0
+    assert llm_response == "Multiple LLM calls (6 samples, threshold), 6 failed requests"
+    assert not is_model_response(llm_response)
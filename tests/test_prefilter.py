@@ -0,0 +1,16 @@
+from particl_moderation.llm.prefilter import Prefilter
+
+def test_summary_reports_the_llm_calls_avoided(monkeypatch):
+    prefilter = Prefilter()
+    monkeypatch.setattr(prefilter, "matches", lambda title, description: ["weapon"] if "gun" in title else [])
+
+    for title in ("gun", "book", "lamp", "chair"):
+        if prefilter.screen(title, "") == "check":
+            prefilter.record_check(escalated=title == "chair")
+        if title in ("gun", "chair"):
+            prefilter.record_classification(6)
+
+    assert prefilter.stats_summary() == (
+        "Prefilter: 3 of 4 listings matched no rule term and got a single LLM sample; 2 were settled by it and "
+        "1 got the full classification, about 10 LLM calls avoided (6.0 samples per classified listing)"
+    )
@@ -0,0 +1,73 @@
+import pytest
+
+from particl_moderation.moderation import voting
+from particl_moderation.moderation.proposal_index import ProposalIndex
+from particl_moderation.particl import search
+
+def proposal(target):
+    return {"type": "MPA_PROPOSAL_ADD", "target": target, "hash": f"proposal-{target}"}
+
+def listing(listing_hash):
+    return {"type": "MPA_LISTING_ADD_03", "hash": listing_hash}
+
+def test_proposals_announced_over_zmq_reach_the_index(fake_inbox, monkeypatch, tmp_path):
+    index = ProposalIndex(str(tmp_path / "proposal_index.json"), str(tmp_path / "proposal_watermark.json"))
+    monkeypatch.setattr(voting, "get_proposal_index", lambda: index)
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)])
+    queued = []
+    monkeypatch.setattr(search, "process_smsg", queued.append)
+
+    fake_inbox.receive("p0", 100, proposal("old-listing"))
+    voting.refresh_proposal_index()
+    assert index.get("old-listing")["hash"] == "proposal-old-listing"
+
+    # A proposal and a listing arrive and are announced over ZMQ
+    fake_inbox.receive("p1", 200, proposal("new-listing"))
+    fake_inbox.receive("l1", 201, listing("new-listing"))
+    search.process_smsg_ids(["p1", "l1"])
+
+    assert [smsg["msgid"] for smsg in queued] == ["l1"]
+    assert fake_inbox.is_read("l1")
+    assert not fake_inbox.is_read("p1")
+
+    assert index.watermark.fetch_mode() == "unread"
+    voting.refresh_proposal_index()
+    assert index.get("new-listing")["hash"] == "proposal-new-listing"
+
+def test_failed_read_forces_a_full_refresh(fake_inbox, monkeypatch, tmp_path):
+    index = ProposalIndex(str(tmp_path / "proposal_index.json"), str(tmp_path / "proposal_watermark.json"))
+    monkeypatch.setattr(voting, "get_proposal_index", lambda: index)
+    fake_inbox.receive("p0", 100, proposal("old-listing"))
+    fake_inbox.receive("p1", 200, proposal("new-listing"))
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)[:60]])
+
+    voting.refresh_proposal_index()
+    assert index.watermark.fetch_mode() == "all"
+
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)])
+    voting.refresh_proposal_index()
+    assert index.get("new-listing")["hash"] == "proposal-new-listing"
+    assert index.watermark.fetch_mode() == "unread"
+
+def test_crash_during_an_unread_read_forces_a_full_refresh(fake_inbox, monkeypatch, tmp_path):
+    paths = str(tmp_path / "proposal_index.json"), str(tmp_path / "proposal_watermark.json")
+    index = ProposalIndex(*paths)
+    monkeypatch.setattr(voting, "get_proposal_index", lambda: index)
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)])
+    fake_inbox.receive("p0", 100, proposal("old-listing"))
+    voting.refresh_proposal_index()
+
+    def crash(mode, action_type):
+        fake_inbox.smsginbox(mode, action_type)
+        raise SystemExit
+    fake_inbox.receive("p1", 200, proposal("new-listing"))
+    monkeypatch.setattr(voting, "stream_inbox", crash)
+    with pytest.raises(SystemExit):
+        voting.refresh_proposal_index()
+
+    # The next run starts from what was saved before the crash
+    index = ProposalIndex(*paths)
+    assert index.watermark.fetch_mode() == "all"
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)])
+    voting.refresh_proposal_index()
+    assert index.get("new-listing")["hash"] == "proposal-new-listing"
@@ -0,0 +1,31 @@
+import time
+
+import pytest
+
+from particl_moderation.particl.smsg_listener import SMSGListener, parse_smsg_notification
+
+zmq = pytest.importorskip("zmq")
+
+MSGID = bytes(range(28))
+
+def test_notification_id_is_taken_from_the_trailing_bytes():
+    assert parse_smsg_notification(b"\x01\x00" + MSGID) == MSGID.hex()
+
+def test_listener_returns_the_announced_ids():
+    publisher = zmq.Context.instance().socket(zmq.PUB)
+    publisher.setsockopt(zmq.LINGER, 0)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+    listener = SMSGListener(f"tcp://127.0.0.1:{port}")
+    try:
+        # A subscription takes a moment to reach the publisher, so keep announcing until one gets through
+        msgids = []
+        deadline = time.monotonic() + 5
+        while not msgids and time.monotonic() < deadline:
+            publisher.send_multipart([b"hashblock", b"\x00" * 32, b"\x00" * 4])
+            publisher.send_multipart([b"smsg", b"\x01\x00" + MSGID, b"\x00" * 4])
+            publisher.send_multipart([b"smsg", b"\x01\x00" + MSGID, b"\x01" + b"\x00" * 3])
+            msgids = listener.wait_for_messages(0.2)
+        assert msgids == [MSGID.hex()]
+    finally:
+        listener.close()
+        publisher.close()
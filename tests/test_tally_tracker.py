@@ -0,0 +1,60 @@
+from particl_moderation.moderation import voting
+from particl_moderation.moderation.tally_tracker import TallyTracker
+from particl_moderation.particl import search
+
+def vote(voter, option):
+    return {"type": "MPA_VOTE", "proposalHash": "proposal", "proposalOptionHash": option,
+            "voter": voter, "signature": f"signature-{voter}"}
+
+def make_tracker(monkeypatch, tmp_path, fake_inbox) -> TallyTracker:
+    tracker = TallyTracker(str(tmp_path / "vote_tally.json"), str(tmp_path / "vote_tally_watermark.json"))
+    monkeypatch.setattr(voting, "get_tally_tracker", lambda: tracker)
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [fake_inbox.smsginbox(mode, action_type)])
+    monkeypatch.setattr(voting, "verify_vote_signatures", lambda votes: [True] * len(votes))
+    return tracker
+
+def test_votes_announced_over_zmq_reach_the_tally(fake_inbox, monkeypatch, tmp_path):
+    tracker = make_tracker(monkeypatch, tmp_path, fake_inbox)
+    monkeypatch.setattr(search, "process_smsg", lambda smsg: None)
+
+    fake_inbox.receive("v0", 100, vote("alice", "keep"))
+    voting.refresh_tally_tracker()
+    assert tracker.tally("proposal", {"alice": 1.0, "bob": 2.0}) == {"keep": 1.0}
+
+    fake_inbox.receive("v1", 200, vote("bob", "remove"))
+    search.process_smsg_ids(["v1"])
+    assert not fake_inbox.is_read("v1")
+
+    voting.refresh_tally_tracker()
+    assert tracker.tally("proposal", {"alice": 1.0, "bob": 2.0}) == {"keep": 1.0, "remove": 2.0}
+
+def test_votes_read_before_a_failed_read_still_count(fake_inbox, monkeypatch, tmp_path):
+    tracker = make_tracker(monkeypatch, tmp_path, fake_inbox)
+    fake_inbox.receive("v0", 100, vote("alice", "keep"))
+    fake_inbox.receive("v1", 200, vote("bob", "remove"))
+    reply = fake_inbox.smsginbox("all", "MPA_VOTE")
+    # Cut the reply off after the first message
+    monkeypatch.setattr(voting, "stream_inbox", lambda mode, action_type: [reply[:reply.index("}, {") + 1]])
+
+    voting.refresh_tally_tracker()
+    assert tracker.voters("proposal") == {"alice"}
+    assert tracker.watermark.fetch_mode() == "all"
+
+def test_missing_balance_leaves_the_proposal_open(monkeypatch, tmp_path):
+    tracker = TallyTracker(str(tmp_path / "vote_tally.json"), str(tmp_path / "vote_tally_watermark.json"))
+    tracker.add("proposal", "keep", "whale", 100)
+    tracker.add("proposal", "keep", "unindexed", 100)
+    proposal = {"hash": "proposal", "options": [{"hash": "keep"}, {"hash": "remove"}]}
+    balances = {"whale": 1000 * 10**8, "ours": 10**8}
+
+    def getaddressbalance(calls, wallet=None):
+        address = lambda params: params[0]["addresses"][0]
+        return [({"balance": balances[address(params)]}, None) if address(params) in balances else (None, "no index")
+                for _, params in calls]
+    monkeypatch.setattr(voting, "rpc_batch", getaddressbalance)
+
+    weights = voting.VoterWeights()
+    assert voting.get_settled_option(tracker, weights, proposal, ["ours"]) is None
+
+    del tracker.votes["proposal"]["unindexed"]
+    assert voting.get_settled_option(tracker, weights, proposal, ["ours"]) == "keep"
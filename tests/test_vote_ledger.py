@@ -0,0 +1,18 @@
+from particl_moderation.moderation.vote_ledger import VoteLedger
+
+def test_sending_prunes_the_oldest_and_expired_votes(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("particl_moderation.moderation.vote_ledger.time.time", lambda: clock[0])
+    ledger = VoteLedger(str(tmp_path / "vote_ledger.db"), max_age=100, max_entries=2)
+
+    for voter in ("a", "b", "c"):
+        clock[0] += 10
+        ledger.record_signed("proposal", "keep", {voter: f"sig-{voter}"})
+        ledger.record_sent("proposal", "keep", [voter])
+    assert set(ledger.votes("proposal", "keep")) == {"b", "c"}
+
+    clock[0] += 95
+    ledger.record_signed("proposal", "remove", {"d": "sig-d"})
+    ledger.record_sent("proposal", "remove", ["d"])
+    assert set(ledger.votes("proposal", "keep")) == {"c"}
+    assert ledger.missing("proposal", "remove", ["c", "d"]) == ["c"]